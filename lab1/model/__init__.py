@@ -1,2 +1,21 @@
-from .model import Model, NetworkParams
-from .tcp_version import TCPVersion, map_tcp_verbose
+from .pcap_index import PcapIndex
+
+
+# Model and the TCP variants import ns-3 when loaded. Resolve them on first use, so the
+# capture tools (python -m model.batch, PcapIndex, tcp_analysis) run without ns-3.
+_LAZY = {
+    "Model": ".model",
+    "NetworkParams": ".model",
+    "FlowStats": ".model",
+    "SimulationResult": ".model",
+    "TCPVersion": ".tcp_version",
+    "TcpProfile": ".tcp_version",
+    "map_tcp_verbose": ".tcp_version",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    return getattr(importlib.import_module(_LAZY[name], __name__), name)
@@ -0,0 +1,186 @@
+import argparse
+import bisect
+import csv
+import glob
+import os
+import re
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from .pcap import GLOBAL_HEADER_LEN, RECORD_HEADER_LEN, PcapReader, five_tuple, tcp_segment
+from .pcap_index import PcapIndex
+
+
+# Captures are named by sim.py as exp<id>-<TCPVersion.name>-...-n#1n#2-<node>-<device>.pcap
+CAPTURE_NAME = re.compile(r"^(?P<experiment>[^-]+)-(?P<variant>[^-]+)-(?:.*-)?(?P<link>n\d+n\d+)-\d+-\d+\.pcap$")
+
+
+@dataclass
+class FlowSummary:
+    packets: int        = 0
+    bytes: int          = 0
+    first: float        = float("inf")
+    last: float         = float("-inf")
+    retransmissions: int = 0
+    max_end: int        = -1
+    # Ends of the segments that advanced the sequence space in this chunk. They are still
+    # retransmissions if an earlier chunk already covered them, which only the reduce step knows.
+    new_ends: list      = field(default_factory=list)
+
+
+@dataclass
+class FileSummary:
+    path: str
+    experiment: str
+    variant: str
+    link: str
+    packets: int = 0
+    bytes: int   = 0
+    flows: dict  = field(default_factory=dict)
+
+
+def chunk_boundaries(path: str, chunk_bytes: int):
+    """Split a capture into (start, end) byte ranges of roughly chunk_bytes on record boundaries."""
+    size = os.path.getsize(path)
+    if size <= GLOBAL_HEADER_LEN + chunk_bytes:
+        return [(GLOBAL_HEADER_LEN, size)]
+
+    if os.path.exists(PcapIndex.sidecar_path(path)):
+        offsets = PcapIndex.open(path, save=False).offsets
+        targets = range(GLOBAL_HEADER_LEN + chunk_bytes, size, chunk_bytes)
+        positions = offsets.searchsorted(list(targets)).clip(max=len(offsets) - 1)
+        starts = sorted({int(offset) for offset in offsets[positions]} | {GLOBAL_HEADER_LEN})
+    else:
+        starts = [GLOBAL_HEADER_LEN]
+        with open(path, "rb") as f:
+            endian = "<" if f.read(4) in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1") else ">"
+            offset = GLOBAL_HEADER_LEN
+            while offset < size:
+                f.seek(offset + 8)
+                caplen = f.read(4)
+                if len(caplen) < 4:
+                    break
+                offset += RECORD_HEADER_LEN + struct.unpack(endian + "I", caplen)[0]
+                if offset - starts[-1] >= chunk_bytes and offset < size:
+                    starts.append(offset)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def summarise_chunk(path: str, start: int, end: int):
+    """Per-flow counters for the records of one byte range of a capture."""
+    flows = {}
+    with PcapReader(path) as reader:
+        for record in reader.records(start, end):
+            flow = five_tuple(reader.linktype, record.data)
+            if flow is None:
+                continue
+            summary = flows.get(flow)
+            if summary is None:
+                summary = flows[flow] = FlowSummary()
+            summary.packets += 1
+            summary.bytes += record.origlen
+            summary.first = min(summary.first, record.time)
+            summary.last = max(summary.last, record.time)
+
+            segment = tcp_segment(reader.linktype, record.data) if flow.proto == 6 else None
+            if segment is None or segment[3] <= 0:
+                continue
+            seq_end = segment[0] + segment[3]
+            if seq_end <= summary.max_end:
+                summary.retransmissions += 1
+            else:
+                summary.max_end = seq_end
+                summary.new_ends.append(seq_end)
+    return path, start, flows
+
+
+def reduce_file(path: str, chunks):
+    """Merge the chunk summaries of one capture, in capture order."""
+    match = CAPTURE_NAME.match(os.path.basename(path))
+    names = match.groupdict() if match else {"experiment": "", "variant": "", "link": ""}
+    result = FileSummary(path, **names)
+    for _, flows in sorted(chunks, key=lambda chunk: chunk[0]):
+        for flow, chunk in flows.items():
+            summary = result.flows.setdefault(flow, FlowSummary())
+            summary.packets += chunk.packets
+            summary.bytes += chunk.bytes
+            summary.first = min(summary.first, chunk.first)
+            summary.last = max(summary.last, chunk.last)
+            summary.retransmissions += chunk.retransmissions + bisect.bisect_right(chunk.new_ends,
+                                                                                 summary.max_end)
+            summary.max_end = max(summary.max_end, chunk.max_end)
+            result.packets += chunk.packets
+            result.bytes += chunk.bytes
+    return result
+
+
+def analyse(paths, workers: int = None, chunk_bytes: int = 64 << 20, progress=sys.stderr):
+    """
+    Summarise many captures across a process pool. Large captures are split into chunks; a
+    capture is reduced as soon as its last chunk is done, so only the chunk summaries of the
+    captures still in progress are held.
+    """
+    jobs = [(path, start, end) for path in paths for start, end in chunk_boundaries(path, chunk_bytes)]
+    pending = {path: 0 for path in paths}
+    for path, _, _ in jobs:
+        pending[path] += 1
+    chunks = {path: [] for path in paths}
+    summaries = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(summarise_chunk, *job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            path, start, flows = future.result()
+            chunks[path].append((start, flows))
+            pending[path] -= 1
+            if pending[path] == 0:
+                summaries[path] = reduce_file(path, chunks.pop(path))
+            if progress is not None:
+                print(f"[{done}/{len(jobs)}] {os.path.basename(path)} @ {start}", file=progress)
+    return [summaries[path] for path in paths]
+
+
+def table(summaries):
+    """Flatten file summaries into one row per (capture, flow)."""
+    rows = []
+    for summary in summaries:
+        for flow, stats in summary.flows.items():
+            duration = stats.last - stats.first
+            rows.append({
+                "experiment": summary.experiment,
+                "variant": summary.variant,
+                "link": summary.link,
+                "flow": str(flow),
+                "packets": stats.packets,
+                "bytes": stats.bytes,
+                "first": stats.first,
+                "last": stats.last,
+                "throughput_mbps": stats.bytes * 8.0 / duration / 1024 / 1024 if duration > 0 else 0.0,
+                "retransmissions": stats.retransmissions,
+                "file": os.path.basename(summary.path),
+            })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise the PCAP captures of a results directory.")
+    parser.add_argument("results", help="directory holding the captures")
+    parser.add_argument("--pattern", default="exp*-*.pcap", help="glob of the captures to analyse")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--chunk-mb", type=int, default=64, help="split captures larger than this")
+    parser.add_argument("--csv", help="write the table to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.results, args.pattern)))
+    rows = table(analyse(paths, args.workers, args.chunk_mb << 20))
+    out = open(args.csv, "w", newline="") if args.csv else sys.stdout
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]) if rows else ["file"])
+    writer.writeheader()
+    writer.writerows(rows)
+    if args.csv:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import ns.core
+
+from .counters import ProbeReceiver
+from .pcap import RECORD_HEADER_LEN, PcapReader
+from .queues import root_queue_disc
+from .tcp_analysis import read_ip_packets
+from .telemetry import schedule_periodic
+from .topology import LINK_NAMES, LINKS
+
+
+class TriggeredCapture:
+    """
+    > PCAP of one link that only keeps the packets around interesting episodes:
+        '''
+        capture = mymodel.enable_triggered_capture("results/exp_retransmissions-n6n7", "n6n7",
+                                                   before_ms=50, after_ms=50)
+        result = mymodel.start()
+        result.captures     # {"results/exp_retransmissions-n6n7-6-3.pcap": [(12.31, "queue drop"), ...]}
+        '''
+    > This is a filter over a full capture, not a capture that only writes when triggered: the
+      Python bindings cannot hook into the packets, so ns-3 captures the first device of link
+      in full into a scratch file next to title while the simulation runs, at the cost of
+      enable_PCAP on that device. What is saved is the space afterwards: close() copies the
+      packets from before_ms before to after_ms after every trigger into the capture file and
+      deletes the scratch file.
+    > The triggers are polled every interval simulated seconds: drops of the device queues and
+      queue discs of either direction, and error drops, the packets a device sent that the
+      other node never received (see counters.ProbeReceiver), counted once delay, the longest
+      time a packet can be on the wire, has passed. With dip set, close() also triggers on
+      dip_interval long intervals whose bytes fall below dip times their running average.
+    > Polled drops are only known to the interval, so their window starts before_ms before the
+      previous poll, for error drops minus delay.
+    > The file is in the format of enable_PCAP, so model.pcap, PcapIndex and tcp_analysis read it.
+    """
+    def __init__(self, title: str, link: str, before_ms: float = 50, after_ms: float = 50,
+                 dip: float = None, interval: float = 0.01, dip_interval: float = 0.1):
+        if before_ms < 0 or after_ms < 0:
+            raise ValueError(f"The capture window ({before_ms} ms, {after_ms} ms) should not be negative.")
+        if dip is not None and not 0 < dip < 1:
+            raise ValueError(f"The throughput dip {dip} should be within (0, 1).")
+        if interval <= 0 or dip_interval <= 0:
+            raise ValueError(f"The intervals ({interval}, {dip_interval}) should be larger than 0.")
+        self.title = title
+        self.link = link
+        self.before = before_ms / 1000
+        self.after = after_ms / 1000
+        self.dip = dip
+        self.interval = interval
+        self.dip_interval = dip_interval
+        self.path = None
+        self.scratch = None
+        self.queues = []
+        self.rows = []
+        self.receiver = None
+        self.delay = 0.0
+        self.dropped = 0
+        self.sent = []          # (time, packets sent on either direction) of every poll
+        self.lost = 0
+        self.triggers = []      # (time, reason, window start)
+
+    def attach(self, helper, devices, monitor, classifier, delay: float, stop_time: float):
+        """
+        Start the scratch capture and the polling. Called by Model.start after all queue discs
+        exist, with delay the longest time a packet takes from one device to the other.
+        """
+        device = devices.Get(0)
+        self.path = f"{self.title}-{device.GetNode().GetId()}-{device.GetIfIndex()}.pcap"
+        self.scratch = tempfile.mkdtemp(prefix=".capture-", dir=os.path.dirname(os.path.abspath(self.path)))
+        helper.EnablePcap(os.path.join(self.scratch, "0.pcap"), device, True, True)
+        for direction in (0, 1):
+            device = devices.Get(direction)
+            self.queues.append((device.GetQueue(), root_queue_disc(device)))
+            self.rows.append(2 * LINK_NAMES.index(self.link) + direction)
+        self.receiver = ProbeReceiver(monitor, classifier, nodes=LINKS[self.link])
+        self.delay = delay
+        schedule_periodic(self.interval, self.poll, stop_time)
+
+    def poll(self):
+        now = ns.core.Simulator.Now().GetSeconds()
+        dropped = sent = 0
+        for queue, queue_disc in self.queues:
+            dropped += queue.GetTotalDroppedPackets()
+            sent += queue.GetTotalReceivedPackets() - queue.GetTotalDroppedPackets() - queue.GetNPackets()
+            if queue_disc is not None:
+                dropped += queue_disc.GetStats().nTotalDroppedPackets
+        if dropped > self.dropped:
+            self.triggers.append((now, "queue drop", now - self.interval - self.before))
+        self.dropped = dropped
+
+        # Everything sent up to delay ago has either arrived or been lost by now. Packets sent
+        # since then that already arrived can only hide losses, never make up ones.
+        self.sent.append((now, sent))
+        settled = [count for time, count in self.sent if time <= now - self.delay]
+        if settled:
+            lost = settled[-1] - int(self.receiver.received()[1][self.rows].sum())
+            if lost > self.lost:
+                self.triggers.append((now, "error drop", now - self.interval - self.delay - self.before))
+                self.lost = lost
+            del self.sent[:len(settled) - 1]
+
+    def close(self) -> list:
+        """Write the capture file and return its episodes, [(time, trigger)]. Called by Model.start after the run."""
+        if self.scratch is None:
+            return []
+        scratch = os.path.join(self.scratch, "0.pcap")
+        packets = read_ip_packets(scratch)
+        triggers = list(self.triggers)
+        if self.dip is not None:
+            triggers += [(time, "throughput dip", time - self.dip_interval - self.before)
+                         for time in throughput_dips(packets, self.dip_interval, self.dip)]
+        triggers.sort()
+
+        windows, episodes, until = [], [], -np.inf
+        for time, reason, start in triggers:
+            if windows and start <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], time + self.after)
+            else:
+                windows.append([start, time + self.after])
+            if time > until:
+                episodes.append((float(time), reason))
+            until = max(until, time + self.after)
+        copy_windows(scratch, self.path, packets.offset, packets.time, windows)
+        shutil.rmtree(self.scratch)
+        self.scratch = None
+        return episodes
+
+
+def throughput_dips(packets, interval: float, dip: float) -> np.ndarray:
+    """Ends of the intervals whose bytes fall below dip times their running average."""
+    if not len(packets.time):
+        return np.zeros(0)
+    edges = np.arange(0.0, packets.time.max(), interval)      # the partial last interval is left out
+    volume = np.histogram(packets.time, edges, weights=packets.size)[0]
+    dips, average = [], None
+    for end, interval_bytes in zip(edges[1:], volume):
+        if average and interval_bytes < dip * average:
+            dips.append(end)
+        average = interval_bytes if average is None else 0.9 * average + 0.1 * interval_bytes
+    return np.array(dips)
+
+
+def copy_windows(source: str, path: str, offsets: np.ndarray, times: np.ndarray, windows):
+    """Copy the records of source within any of windows [(start, end)] to path, byte for byte."""
+    keep = np.zeros(len(times), dtype=bool)
+    for start, end in windows:
+        keep[np.searchsorted(times, start):np.searchsorted(times, end, side="right")] = True
+    with PcapReader(source) as reader, open(path, "wb") as out:
+        out.write(reader.header)
+        for offset in offsets[keep]:
+            caplen = reader.read_at(int(offset)).caplen
+            reader.file.seek(int(offset))
+            out.write(reader.file.read(RECORD_HEADER_LEN + caplen))
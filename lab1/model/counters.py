@@ -0,0 +1,125 @@
+import numpy as np
+import ns.core
+
+from .queues import root_queue_disc
+from .telemetry import schedule_periodic
+from .topology import LINK_NAMES, LINKS, N_DIRECTED, directed_link, interface_address, shortest_path
+
+
+COUNTERS = ("tx_bytes", "tx_packets", "rx_bytes", "rx_packets", "queue_drops", "error_drops")
+SEND_COUNTERS = ("tx_bytes", "tx_packets", "queue_drops")
+ADDRESS_NODE = {interface_address(link, node): node for link, nodes in LINKS.items() for node in nodes}
+PPP_HEADER_BYTES = 2        # PointToPointNetDevice frames every IP packet with a 2-byte PPP header
+
+
+class LinkCounters:
+    """
+    > Traffic and drops of every directed link, sampled every interval simulated seconds.
+      Enabled with Model.enable_link_counters:
+        '''
+        mymodel.enable_link_counters(0.1)
+        result = mymodel.start()
+        result.link_counters["queue_drops"]     # N_DIRECTED x samples, per interval
+        utilization(result, NETPARAMS.rate).max(axis=1)
+        '''
+    > Rows follow topology: 2 * i is a -> b of the i-th link of LINKS, 2 * i + 1 is b -> a.
+      tx is what left the device queue of the sender, rx what arrived at the receiving node,
+      queue_drops are drops of the sender's device queue and queue disc and error_drops those
+      of the receiver's error model. Bytes are PPP frames, the IP packet plus PPP_HEADER_BYTES,
+      on both sides.
+    > Everything is polled, no trace callbacks: tx and queue drops from the queues, rx from the
+      per-node FlowMonitor probes (see ProbeReceiver). error_drops are tx minus rx, so a sample
+      also counts the few packets still on the wire; they even out in the next.
+    > The queues cost a few calls per link and sample, but the probes cost a pass over every
+      flow at every node of its path per sample, which dominates with thousands of flows.
+      With receive=False only SEND_COUNTERS are sampled.
+    """
+    def __init__(self, interval: float = 0.1, receive: bool = True):
+        if interval <= 0:
+            raise ValueError(f"The link counter interval {interval} should be larger than 0.")
+        self.interval = interval
+        self.receive = receive
+        self.counters = COUNTERS if receive else SEND_COUNTERS
+        self.senders = []
+        self.receiver = None
+        self.times = []
+        self.samples = []
+
+    def attach(self, p2p_links: dict, monitor, classifier, stop_time: float):
+        """Start the polling. Called by Model.start before Simulator.Run, after all queue discs exist."""
+        for name, devices in p2p_links.items():
+            for direction in (0, 1):
+                row = 2 * LINK_NAMES.index(name) + direction
+                sender = devices.Get(direction)
+                self.senders.append((row, sender.GetQueue(), root_queue_disc(sender)))
+        if self.receive:
+            self.receiver = ProbeReceiver(monitor, classifier)
+        schedule_periodic(self.interval, self.sample, stop_time)
+
+    def sample(self):
+        totals = np.zeros((N_DIRECTED, len(COUNTERS)), dtype=np.int64)
+        for row, queue, queue_disc in self.senders:
+            totals[row, 0] = queue.GetTotalReceivedBytes() - queue.GetTotalDroppedBytes() - queue.GetNBytes()
+            totals[row, 1] = queue.GetTotalReceivedPackets() - queue.GetTotalDroppedPackets() - queue.GetNPackets()
+            totals[row, 4] = queue.GetTotalDroppedPackets()
+            if queue_disc is not None:
+                totals[row, 4] += queue_disc.GetStats().nTotalDroppedPackets
+        if self.receiver is not None:
+            totals[:, 2], totals[:, 3] = self.receiver.received()
+            totals[:, 5] = totals[:, 1] - totals[:, 3]
+        self.times.append(ns.core.Simulator.Now().GetSeconds())
+        self.samples.append(totals[:, [COUNTERS.index(counter) for counter in self.counters]])
+
+    def matrices(self):
+        """(times, {counter: N_DIRECTED x samples array of the counts within every interval})."""
+        n = len(self.counters)
+        cumulative = np.array(self.samples, dtype=np.int64).reshape(len(self.times), N_DIRECTED, n)
+        per_interval = np.diff(cumulative, axis=0, prepend=np.zeros((1, N_DIRECTED, n), dtype=np.int64))
+        return np.array(self.times), {counter: per_interval[:, :, i].T for i, counter in enumerate(self.counters)}
+
+
+class ProbeReceiver:
+    """
+    > What arrived on every directed link so far, read from the per-node FlowMonitor probes:
+      the packets of a flow a node saw are attributed to the link the flow enters that node by
+      on its shortest path. Model refuses to combine it with links going down, which reroutes.
+    > Each call is a pass over every flow at every node of its path, or only at nodes.
+    """
+    def __init__(self, monitor, classifier, nodes=None):
+        # FlowMonitorHelper.InstallAll adds one probe per node, in node order.
+        probes = list(monitor.GetAllProbes())
+        self.probes = [(node, probes[node]) for node in (range(len(probes)) if nodes is None else nodes)]
+        self.classifier = classifier
+        self.hops = {}
+
+    def incoming(self, flow_id: int) -> dict:
+        """node -> row the flow arrives on, for all nodes of its path but the source."""
+        if flow_id not in self.hops:
+            t = self.classifier.FindFlow(flow_id)
+            path = shortest_path(ADDRESS_NODE[str(t.sourceAddress)], ADDRESS_NODE[str(t.destinationAddress)])
+            self.hops[flow_id] = {b: directed_link(a, b) for a, b in zip(path, path[1:])}
+        return self.hops[flow_id]
+
+    def received(self) -> tuple:
+        """(bytes, packets) N_DIRECTED arrays, bytes as PPP frames."""
+        rx_bytes = np.zeros(N_DIRECTED, dtype=np.int64)
+        rx_packets = np.zeros(N_DIRECTED, dtype=np.int64)
+        for node, probe in self.probes:
+            for flow_id, stats in probe.GetStats():
+                row = self.incoming(flow_id).get(node)
+                if row is not None:
+                    rx_bytes[row] += stats.bytes + PPP_HEADER_BYTES * stats.packets
+                    rx_packets[row] += stats.packets
+        return rx_bytes, rx_packets
+
+
+def utilization(result, rate: int):
+    """N_DIRECTED x samples fraction of rate (bits/s) every directed link was busy transmitting."""
+    interval = np.diff(result.link_times, prepend=0.0)
+    return np.asarray(result.link_counters["tx_bytes"]) * 8 / interval / rate
+
+
+def bottleneck(result, rate: int) -> tuple:
+    """(directed link, mean utilization) of the busiest directed link of the run."""
+    mean = utilization(result, rate).mean(axis=1)
+    return int(mean.argmax()), float(mean.max())
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+import numpy as np
+import ns.core
+
+from .telemetry import schedule_periodic
+
+
+@dataclass
+class LinkEvent:
+    time: float
+    link: str
+    rate: int           = None
+    up: bool            = None
+    error_rate: float   = None
+
+
+class ThroughputSampler:
+    """
+    Samples the rx bytes of every flow from FlowMonitor every interval simulated seconds.
+    Enabled with Model.enable_throughput_sampling, see SimulationResult.throughput.
+    """
+    def __init__(self, interval: float = 0.1):
+        if interval <= 0:
+            raise ValueError(f"The sampling interval {interval} should be larger than 0.")
+        self.interval = interval
+        self.times = []
+        self.samples = []
+        self.monitor = None
+
+    def attach(self, monitor, stop_time: float):
+        self.monitor = monitor
+        schedule_periodic(self.interval, self.sample, stop_time)
+
+    def sample(self):
+        self.times.append(ns.core.Simulator.Now().GetSeconds())
+        self.samples.append({flow_id: flow_stats.rxBytes for flow_id, flow_stats in self.monitor.GetFlowStats()})
+
+    def throughput(self, flow_ids):
+        """(times, Mbps) with one column per flow id, averaged over every sampling interval."""
+        times = np.array(self.times)
+        rx = np.array([[sample.get(flow_id, 0) for flow_id in flow_ids] for sample in self.samples],
+                      dtype=float).reshape(len(times), len(flow_ids))
+        previous = np.vstack([np.zeros((1, len(flow_ids))), rx[:-1]])
+        return times, (rx - previous) * 8 / self.interval / 1024 / 1024
+
+
+def recovery_time(times, throughput, event_time: float, window: float = 1.0, fraction: float = 0.9,
+                  target: float = None) -> float:
+    """
+    Seconds after event_time until the throughput, averaged over the last window seconds, is
+    back at fraction of target. target defaults to the average over the window before the
+    event. Returns inf if it never recovers.
+    """
+    times = np.asarray(times, dtype=float)
+    throughput = np.asarray(throughput, dtype=float)
+    if target is None:
+        before = (times > event_time - window) & (times <= event_time)
+        if not before.any():
+            raise ValueError(f"There are no samples in the {window}s before {event_time}s.")
+        target = throughput[before].mean()
+    cumulative = np.concatenate([[0.0], np.cumsum(throughput)])
+    n = max(1, int(round(window / np.median(np.diff(times))))) if len(times) > 1 else 1
+    for i in np.flatnonzero(times > event_time):
+        first = max(i + 1 - n, 0)
+        if times[first] <= event_time:
+            continue
+        if (cumulative[i + 1] - cumulative[first]) / (i + 1 - first) >= fraction * target:
+            return float(times[i] - event_time)
+    return float("inf")
@@ -0,0 +1,222 @@
+import statistics
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .model import LINKS, FlowStats, SimulationResult, STOP_TIME
+from .tcp_version import TCPVersion
+from .topology import N_DIRECTED, directed_link, interface_address, match_flows, shortest_path, source_address
+
+
+PACKET_BYTES    = 1500
+ON_TIME         = 2.0       # OnOff application of Model.SetupTcpConnection
+OFF_TIME        = 1.0
+UDP_RATE        = 1024 * 8 / 0.01      # UdpEchoClient of Model.SetupUdpConnection, bits/s
+UDP_BYTES       = 1024 * 1000
+XPONG_RATE      = 2 * (4 + 28) * 8 / 0.01   # XPongPeer: CMD and ACK every tick, with IP/UDP headers
+
+# Additive increase (packets per RTT) and multiplicative decrease factor of an AIMD fit of
+# every TCPVersion. Delay-based and rate-based variants are poor fits, see calibrate.
+AIMD = {
+    TCPVersion.Cubic:       (1.0, 0.7),
+    TCPVersion.Bic:         (1.0, 0.8),
+    TCPVersion.HighSpeed:   (2.0, 0.7),
+    TCPVersion.Scalable:    (1.0, 0.875),
+    TCPVersion.Illinois:    (2.0, 0.7),
+    TCPVersion.Dctcp:       (1.0, 0.5),
+}
+DEFAULT_AIMD = (1.0, 0.5)
+
+
+@dataclass
+class FluidModel:
+    """
+    > Fluid approximation of Model for quick pre-screening of scenarios. Solves, for a whole
+      batch of Scenarios at once,
+        '''
+        dW/dt = a / RTT - (1 - b) * W * rate * p        TCP window, packets
+        dq/dt = arrival - capacity                      every directed link, bounded by buffer
+        '''
+      with Euler steps of dt, where p is the path loss from full queues and add_error links.
+    > TCP flows follow the OnOff application of Model (2 s on, 1 s off, capped at on_off_rate),
+      UDP flows the echo client (1024 bytes every 10 ms, 1000 packets).
+    > solve returns one SimulationResult per scenario with one FlowStats per application, so
+      results compare directly with Model.start(). ACK flows and source ports are not modelled.
+    > Check calibrate before trusting it for a TCPVersion or load regime.
+    """
+    dt: float               = 0.005
+    buffer_packets: int     = 1100      # pfifo_fast queue disc plus the device queue
+    max_window: float       = 90.0      # default TCP receive buffer, in packets
+
+    def solve(self, scenarios) -> list:
+        scenarios = list(scenarios)
+        if not scenarios:
+            return []
+        S = len(scenarios)
+        F = max(1, max(len(scenario.applications) for scenario in scenarios))
+
+        route = np.zeros((S, F, N_DIRECTED))
+        valid = np.zeros((S, F), dtype=bool)
+        tcp = np.zeros((S, F), dtype=bool)
+        start = np.zeros((S, F))
+        stop = np.zeros((S, F))
+        cap = np.zeros((S, F))
+        budget = np.full((S, F), np.inf)
+        alpha = np.ones((S, F))
+        beta = np.full((S, F), 0.5)
+        capacity = np.zeros((S, N_DIRECTED))
+        delay = np.zeros((S, N_DIRECTED))
+        error = np.zeros((S, N_DIRECTED))
+
+        for s, scenario in enumerate(scenarios):
+            params = scenario.netparams
+            capacity[s] = params.rate / 8
+            delay[s] = int(params.latency_ms) / 1000
+            for link, rate in scenario.error_rates().items():
+                a, b = LINKS[link]
+                error[s, directed_link(a, b)] = rate
+            a, b = AIMD.get(scenario.tcp_version, DEFAULT_AIMD)
+            for f, (src, dst, _, start_time, stop_time, kind, _) in enumerate(scenario.applications):
+                path = shortest_path(src, dst)
+                for hop in zip(path, path[1:]):
+                    route[s, f, directed_link(*hop)] = 1
+                valid[s, f] = True
+                tcp[s, f] = kind == "TCP"
+                start[s, f] = start_time
+                stop[s, f] = min(stop_time, STOP_TIME)
+                cap[s, f] = application_rate(kind, params) / 8
+                if kind == "UDP":
+                    budget[s, f] = UDP_BYTES
+                alpha[s, f], beta[s, f] = a, b
+
+        propagation = 2 * _along(route, delay) + 1e-4
+        buffer = self.buffer_packets * PACKET_BYTES
+        window = np.ones((S, F))
+        queue = np.zeros((S, N_DIRECTED))
+        sent = np.zeros((S, F))
+        received = np.zeros((S, F))
+        first_tx = np.full((S, F), np.inf)
+        last_rx = np.zeros((S, F))
+
+        routeT = route.transpose(0, 2, 1).copy()
+        for t in np.arange(0, STOP_TIME, self.dt):
+            active = valid & (t >= start) & (t < stop) & (sent < budget)
+            active &= ~tcp | ((t - start) % (ON_TIME + OFF_TIME) >= OFF_TIME)
+            rtt = propagation + _along(route, queue / capacity)
+            rate = np.where(tcp, np.minimum(window * PACKET_BYTES / rtt, cap), cap) * active
+
+            arrival = _along(routeT, rate)
+            queue = np.clip(queue + (arrival - capacity) * self.dt, 0, buffer)
+            overflow = np.where(queue >= buffer, 1 - capacity / np.maximum(arrival, 1e-9), 0).clip(0, 1)
+            survive = (1 - overflow) * (1 - error)
+            loss = 1 - np.exp(_along(route, np.log(np.maximum(survive, 1e-12))))
+
+            growth = alpha / rtt - (1 - beta) * window * rate / PACKET_BYTES * loss
+            window = np.where(tcp & active, np.clip(window + growth * self.dt, 1, self.max_window), window)
+            delivered = rate * (1 - loss)
+            sent += rate * self.dt
+            received += delivered * self.dt
+            first_tx[(rate > 0) & np.isinf(first_tx)] = t
+            last_rx[delivered > 0] = t
+
+        results = []
+        for s, scenario in enumerate(scenarios):
+            flows = []
+            for f, (src, dst, dst_addr, _, _, kind, port) in enumerate(scenario.applications):
+                tx_packets = int(sent[s, f] / PACKET_BYTES)
+                rx_packets = int(received[s, f] / PACKET_BYTES)
+                flows.append(FlowStats(flow_id=f + 1,
+                                       protocol=kind,
+                                       source=source_address(src, dst),
+                                       source_port=0,
+                                       destination=interface_address(dst_addr, LINKS[dst_addr][0]),
+                                       destination_port=port,
+                                       tx_bytes=int(sent[s, f]),
+                                       rx_bytes=int(received[s, f]),
+                                       tx_packets=tx_packets,
+                                       rx_packets=rx_packets,
+                                       lost_packets=tx_packets - rx_packets,
+                                       first_tx=float(first_tx[s, f]) if np.isfinite(first_tx[s, f]) else 0.0,
+                                       last_rx=float(last_rx[s, f] + propagation[s, f] / 2)))
+            results.append(SimulationResult(flows))
+        return results
+
+
+def _along(matrix, vector):
+    """Batched matrix-vector product: (S, M, N) x (S, N) -> (S, M)."""
+    return np.einsum("smn,sn->sm", matrix, vector)
+
+
+def application_rate(kind: str, params) -> float:
+    """Peak rate in bits/s an application of kind offers to its path."""
+    return {"TCP": params.on_off_rate, "XPONG": XPONG_RATE}.get(kind, UDP_RATE)
+
+
+def offered_load(scenario) -> float:
+    """Highest ratio of offered application rate to capacity over all directed links."""
+    load = np.zeros(N_DIRECTED)
+    for src, dst, _, _, _, kind, _ in scenario.applications:
+        path = shortest_path(src, dst)
+        for hop in zip(path, path[1:]):
+            load[directed_link(*hop)] += application_rate(kind, scenario.netparams)
+    return float(load.max() / scenario.netparams.rate) if len(scenario.applications) else 0.0
+
+
+def load_band(load: float) -> str:
+    return "under" if load < 0.8 else "near" if load <= 1.2 else "over"
+
+
+@dataclass
+class CalibrationRow:
+    tcp_version: str
+    load: float
+    flow: str
+    ns3_mbps: float
+    fluid_mbps: float
+
+    @property
+    def error(self) -> float:
+        return (self.fluid_mbps - self.ns3_mbps) / self.ns3_mbps if self.ns3_mbps else float("inf")
+
+
+@dataclass
+class CalibrationReport:
+    rows: list = field(default_factory=list)
+
+    def summary(self) -> dict:
+        """(tcp_version, load band) -> (flows, median and 90th percentile of |relative error|)."""
+        groups = {}
+        for row in self.rows:
+            groups.setdefault((row.tcp_version, load_band(row.load)), []).append(abs(row.error))
+        return {group: (len(errors), statistics.median(errors), float(np.percentile(errors, 90)))
+                for group, errors in sorted(groups.items())}
+
+    def trustworthy(self, tolerance: float = 0.2) -> list:
+        """The groups whose 90th percentile relative throughput error is within tolerance."""
+        return [group for group, (_, _, p90) in self.summary().items() if p90 <= tolerance]
+
+    def __str__(self):
+        lines = [f"{'tcp_version':<12} {'load':<6} {'flows':>6} {'median':>8} {'p90':>8}"]
+        for (tcp_version, band), (count, median, p90) in self.summary().items():
+            lines.append(f"{tcp_version:<12} {band:<6} {count:>6} {median:>8.1%} {p90:>8.1%}")
+        return "\n".join(lines)
+
+
+def calibrate(pairs, fluid: FluidModel = None) -> CalibrationReport:
+    """
+    Compare the fluid model against ns-3 runs, given as (Scenario, SimulationResult) pairs,
+    e.g. [(Scenario.from_key(key), result) for key, result in ResultStore(path).records()].
+    """
+    pairs = list(pairs)
+    fluid = fluid if fluid is not None else FluidModel()
+    predicted = fluid.solve([scenario for scenario, _ in pairs])
+    report = CalibrationReport()
+    for (scenario, result), prediction in zip(pairs, predicted):
+        load = offered_load(scenario)
+        for flow, match in zip(prediction.flows, match_flows(scenario, result)):
+            if match is None:
+                continue
+            report.rows.append(CalibrationRow(scenario.tcp_version.name, load,
+                                              f"{flow.source} --> {flow.destination}/{flow.destination_port}",
+                                              match.throughput_mbps, flow.throughput_mbps))
+    return report
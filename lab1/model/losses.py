@@ -0,0 +1,125 @@
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import ns.core
+import ns.network
+
+
+PACKET_BYTES = 1500     # full-size packet, the time step of GilbertElliott
+
+
+@dataclass
+class RateLoss:
+    """Independent loss of every packet with probability error_rate (ns-3 RateErrorModel)."""
+    error_rate: float
+
+    def validate(self):
+        if not 0 < self.error_rate <= 1:
+            raise ValueError(f"The error rate {self.error_rate} should be within (0, 1].")
+
+    @property
+    def mean_loss(self) -> float:
+        return self.error_rate
+
+    def create(self, stream: int, rate: int, duration: float):
+        return _rate_error_model(self.error_rate, stream)
+
+
+@dataclass
+class GilbertElliott:
+    """
+    > Two-state burst loss: every step the channel moves from good to bad with probability
+      p_good_bad and back with p_bad_good, and loses packets with loss_good or loss_bad. The
+      mean burst length is 1 / p_bad_good steps.
+    > A step is the time a full-size packet takes at the link rate, so on a link busy with
+      full-size packets a step is a packet. The states are drawn up front and switch the
+      ErrorRate of one RateErrorModel at scheduled times, which keeps the per-packet cost
+      that of RateLoss. The link rate is the one of netparams, so Model.schedule refuses to
+      change the data rate of a link with this loss.
+    """
+    p_good_bad: float
+    p_bad_good: float
+    loss_good: float    = 0.0
+    loss_bad: float     = 1.0
+
+    def validate(self):
+        for name in ("p_good_bad", "p_bad_good", "loss_good", "loss_bad"):
+            if not 0 <= getattr(self, name) <= 1:
+                raise ValueError(f"{name} {getattr(self, name)} should be within [0, 1].")
+        if self.p_bad_good == 0:
+            raise ValueError("p_bad_good should be larger than 0, or the channel never leaves the bad state.")
+
+    @property
+    def mean_loss(self) -> float:
+        bad = self.p_good_bad / (self.p_good_bad + self.p_bad_good)
+        return (1 - bad) * self.loss_good + bad * self.loss_bad
+
+    def transitions(self, rng, n: float):
+        """(steps, loss) of every state change within the first n steps, starting in the good state."""
+        if self.p_good_bad == 0:
+            return np.zeros(0), np.zeros(0)
+        # Alternating good and bad sojourns, drawn in batches until they cover n steps.
+        k = int(n / (1 / self.p_good_bad + 1 / self.p_bad_good) * 1.2) + 16
+        while True:
+            lengths = np.column_stack([rng.geometric(self.p_good_bad, k),
+                                       rng.geometric(self.p_bad_good, k)]).ravel()
+            ends = np.cumsum(lengths)
+            if ends[-1] >= n:
+                break
+            k *= 2
+        ends = ends[ends < n]
+        return ends, np.where(np.arange(len(ends)) % 2 == 0, self.loss_bad, self.loss_good)
+
+    def create(self, stream: int, rate: int, duration: float):
+        error_model = _rate_error_model(self.loss_good, stream)
+        rng = np.random.default_rng([ns.core.RngSeedManager.GetSeed(), ns.core.RngSeedManager.GetRun(), stream])
+        step = PACKET_BYTES * 8 / rate
+        for at, loss in zip(*self.transitions(rng, duration / step)):
+            ns.core.Simulator.Schedule(ns.core.Seconds(at * step), _set_error_rate, error_model, float(loss))
+        return error_model
+
+
+@dataclass
+class DropList:
+    """
+    Drop exactly the given packets, numbered from 0 in the order the link receives them.
+    ReceiveListErrorModel looks every packet up in the whole list, so keep it short.
+    """
+    packets: list = field(default_factory=list)
+
+    def validate(self):
+        if any(packet < 0 for packet in self.packets):
+            raise ValueError("The packet numbers of a drop list should not be negative.")
+
+    @property
+    def mean_loss(self) -> float:
+        return 0.0      # depends on the traffic on the link
+
+    def create(self, stream: int, rate: int, duration: float):
+        error_model = ns.network.ReceiveListErrorModel()
+        error_model.SetList(sorted({int(packet) for packet in self.packets}))
+        return error_model
+
+
+LOSS_MODELS = {cls.__name__: cls for cls in (RateLoss, GilbertElliott, DropList)}
+
+
+def _rate_error_model(error_rate: float, stream: int):
+    error_model = ns.network.RateErrorModel()
+    error_model.SetAttribute("ErrorUnit", ns.core.StringValue("ERROR_UNIT_PACKET"))
+    error_model.SetAttribute("ErrorRate", ns.core.DoubleValue(error_rate))
+    error_model.AssignStreams(stream)
+    return error_model
+
+
+def _set_error_rate(error_model, error_rate: float):
+    error_model.SetAttribute("ErrorRate", ns.core.DoubleValue(error_rate))
+
+
+def loss_to_dict(loss) -> dict:
+    return {"model": type(loss).__name__, **asdict(loss)}
+
+
+def loss_from_dict(record: dict):
+    fields = dict(record)
+    return LOSS_MODELS[fields.pop("model")](**fields)
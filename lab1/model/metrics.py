@@ -0,0 +1,38 @@
+def data_flows(result, ports=None) -> list:
+    """The flows of a result that carry application data, i.e. not the reverse ACK flows."""
+    if ports is None:
+        ports = {flow.destination_port for flow in result.flows if flow.destination_port < 49152}
+    return [flow for flow in result.flows if flow.destination_port in ports]
+
+
+def loss_rate(flows) -> float:
+    """Fraction of the packets sent by flows that never arrived."""
+    tx = sum(flow.tx_packets for flow in flows)
+    return sum(flow.lost_packets for flow in flows) / tx if tx else 0.0
+
+
+def jain_fairness(values) -> float:
+    """Jain's fairness index: 1 when all values are equal, 1/n when one takes everything."""
+    values = list(values)
+    square_sum = sum(value * value for value in values)
+    return sum(values) ** 2 / (len(values) * square_sum) if square_sum else 1.0
+
+
+def throughputs(flows) -> list:
+    return [flow.throughput_mbps for flow in flows]
+
+
+def queueing_delay_ms(queue: dict, rate: int) -> float:
+    """Mean queueing delay of a SimulationResult.queues entry on a link of rate bits/s."""
+    return queue["mean_queue_bytes"] * 8 / rate * 1000
+
+
+def mark_fraction(queue: dict) -> float:
+    """Fraction of the packets of a SimulationResult.queues entry that were ECN marked."""
+    return queue["marked"] / queue["enqueued"] if queue["enqueued"] else 0.0
+
+
+def epoch_latencies(result) -> list:
+    """Completion latency in seconds of every completed epoch of every XPong player of a result."""
+    return [float(latency) for peer in (result.xpong or {}).values()
+            for latency in peer["latency"] if latency == latency]
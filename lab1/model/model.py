@@ -4,10 +4,33 @@ import ns.internet
 import ns.network
 import ns.point_to_point
 import ns.flow_monitor
-
-
-from dataclasses import dataclass
-from .tcp_version import TCPVersion, map_tcp_verbose
+import ns.traffic_control
+
+import atexit
+import sys
+import time
+from dataclasses import dataclass, field, replace
+from .tcp_version import TCPVersion, TcpProfile, map_tcp_verbose
+
+
+# The fixed topology: link name -> the two nodes it connects.
+LINKS = {
+    "n0n5": (0, 5),
+    "n1n6": (1, 6),
+    "n2n6": (2, 6),
+    "n3n7": (3, 7),
+    "n4n7": (4, 7),
+    "n5n6": (5, 6),
+    "n5n7": (5, 7),
+    "n6n7": (6, 7),
+}
+LINK_NAMES = list(LINKS)
+N_NODES = 8
+STOP_TIME = 60.0
+
+# Nodes 5, 6 and 7 are the routers. Every other node hangs off one of them.
+ROUTERS = (5, 6, 7)
+ACCESS_ROUTER = {0: 5, 1: 6, 2: 6, 3: 7, 4: 7}
 
 
 @dataclass
@@ -18,6 +41,223 @@ class NetworkParams:
     error_rate: float   = 0.0
 
 
+@dataclass
+class FlowStats:
+    flow_id: int
+    protocol: str
+    source: str
+    source_port: int
+    destination: str
+    destination_port: int
+    tx_bytes: int       = 0
+    rx_bytes: int       = 0
+    tx_packets: int     = 0
+    rx_packets: int     = 0
+    lost_packets: int   = 0
+    first_tx: float     = 0.0
+    last_rx: float      = 0.0
+
+    @property
+    def five_tuple(self):
+        return (self.protocol, self.source, self.source_port, self.destination, self.destination_port)
+
+    @property
+    def throughput_mbps(self) -> float:
+        duration = self.last_rx - self.first_tx
+        return self.rx_bytes * 8.0 / duration / 1024 / 1024 if duration > 0 else 0.0
+
+
+@dataclass
+class SimulationResult:
+    flows: list             = field(default_factory=list)
+    sim_time: float         = STOP_TIME
+    truncated: bool         = False
+    truncation_reason: str  = ""
+    throughput_times: list  = None     # enable_throughput_sampling: sample times (s) and
+    throughput: list        = None     # Mbps per sample (row) and flow (column, as in flows)
+    queues: dict            = None     # add_marking_queue: QueueMonitor.stats()
+    captures: dict          = None     # enable_triggered_capture: file -> [(time, trigger)]
+    xpong: dict             = None     # XPONG applications: "n<node>:<port>" -> XPongPeer.stats()
+    link_times: list        = None     # enable_link_counters: sample times (s) and
+    link_counters: dict     = None     # counter -> directed links x samples, see LinkCounters
+    sink_rx: dict           = None     # TCP sinks: "n<node>:<port>" -> application bytes received
+    remote_flows: list      = None     # distributed: flows crossing ranks without a sink, transmit counters only
+
+    def print_flows(self):
+        if self.truncated:
+            print ("Truncated at %fs: %s" % (self.sim_time, self.truncation_reason))
+        for flow in self.flows:
+            print ("FlowID: %i (%s %s/%s --> %s/%i)" %
+                    (flow.flow_id, flow.protocol, flow.source, flow.source_port, flow.destination,
+                     flow.destination_port))
+            print ("  Tx Bytes: %i" % flow.tx_bytes)
+            print ("  Rx Bytes: %i" % flow.rx_bytes)
+            print ("  Lost Pkt: %i" % flow.lost_packets)
+            print ("  Flow active: %fs - %fs" % (flow.first_tx, flow.last_rx))
+            print ("  Throughput: %f Mbps" % flow.throughput_mbps)
+        for name, queue in (self.queues or {}).items():
+            if queue.get("step") and queue["unforced"]:
+                print ("Step queue %s marked or dropped %i packets below K" % (name, queue["unforced"]))
+        if self.remote_flows:
+            print ("%i flows cross MPI ranks without a sink and have no receive stats, see remote_flows"
+                   % len(self.remote_flows))
+
+
+_mpi_enabled = False
+
+
+def _enable_mpi():
+    """
+    Initialise MPI for the distributed simulator, once per process. MPI cannot be initialised
+    again after MpiInterface.Disable finalises it, so it stays up for every distributed Model
+    of the process and is finalised at exit.
+    """
+    global _mpi_enabled
+    from ns import mpi
+    if not _mpi_enabled:
+        mpi.MpiInterface.Enable(sys.argv)
+        atexit.register(mpi.MpiInterface.Disable)
+        _mpi_enabled = True
+
+
+def default_partition(ranks: int) -> dict:
+    """Spread the routers over the ranks and keep every access link inside one rank."""
+    partition = {router: i % ranks for i, router in enumerate(ROUTERS)}
+    partition.update({node: partition[router] for node, router in ACCESS_ROUTER.items()})
+    return partition
+
+
+def _scheduled_error_rate_conflict(link: str, loss) -> str:
+    return f"The link {link} has scheduled error rates, which need a RateLoss, not {type(loss).__name__}."
+
+
+def _link_down_conflict(what: str) -> str:
+    return (f"The {what} attribute the packets nodes received to links along the shortest paths, "
+            f"which taking links down or up would reroute.")
+
+
+def _scheduled_rate_conflict(link: str) -> str:
+    return (f"The GilbertElliott loss of link {link} times its bursts at the data rate of netparams, "
+            f"so the data rate of {link} cannot be scheduled.")
+
+
+def _address_nodes() -> dict:
+    from .topology import interface_address
+    return {interface_address(link, node): node for link, ends in LINKS.items() for node in ends}
+
+
+def crosses_ranks(flow, partition: dict) -> bool:
+    """Whether the path of flow passes through nodes of more than one rank."""
+    from .topology import shortest_path
+    nodes = _address_nodes()
+    path = shortest_path(nodes[flow.source], nodes[flow.destination])
+    return len({partition[node] for node in path}) > 1
+
+
+def merge_flow_stats(per_rank, partition: dict, profile: TcpProfile) -> tuple:
+    """
+    Combine the FlowMonitor stats and TCP sink progress (SinkMonitor.progress) of every rank,
+    [(flows, sinks)], into (flows, remote_flows).
+    > FlowMonitor only follows the packets a rank sent itself: a flow whose path crosses ranks
+      has transmit counters on its sending rank and no receive counters on any rank. A TCP
+      flow that has a sink to itself takes its receive side from that sink on the rank of its
+      destination instead. The sink counts application bytes, so rx_packets are the full-size
+      segments that carry them and rx_bytes adds their headers (profile.header_bytes); last_rx
+      is the last poll the sink grew and lost_packets is tx_packets - rx_packets, which also
+      counts retransmissions, the handshake and the FIN.
+    > Crossing flows without such a sink, the ACKs of TCP connections and UDP, keep only their
+      transmit counters and are returned apart in remote_flows.
+    """
+    nodes = _address_nodes()
+    sinks, all_flows = {}, []
+    for rank_flows, rank_sinks in per_rank:
+        all_flows += rank_flows
+        sinks.update(rank_sinks)
+    def sink(flow):
+        return f"n{nodes[flow.destination]}:{flow.destination_port}" if flow.protocol == "TCP" else None
+    sharing = {}
+    for flow in all_flows:
+        sharing[sink(flow)] = sharing.get(sink(flow), 0) + 1
+
+    flows, remote = [], []
+    for flow in all_flows:
+        if not crosses_ranks(flow, partition):
+            flows.append(flow)
+        elif sink(flow) in sinks and sharing[sink(flow)] == 1:
+            rx_bytes, flow.last_rx = sinks[sink(flow)]
+            flow.rx_packets = -(-rx_bytes // profile.segment_size)
+            flow.rx_bytes = rx_bytes + flow.rx_packets * profile.header_bytes
+            flow.lost_packets = max(flow.tx_packets - flow.rx_packets, 0)
+            flows.append(flow)
+        else:
+            flow.rx_bytes = flow.rx_packets = flow.lost_packets = 0
+            flow.last_rx = 0.0
+            remote.append(flow)
+    flows.sort(key=lambda flow: (flow.first_tx, flow.five_tuple))
+    remote.sort(key=lambda flow: (flow.first_tx, flow.five_tuple))
+    for flow_id, flow in enumerate(flows + remote, 1):
+        flow.flow_id = flow_id
+    return flows, remote
+
+
+class Budget:
+    """
+    Stops the simulator cleanly once a run has used max_wall_time seconds or executed max_events
+    events, checked every interval simulated seconds. See Model.start.
+    """
+    def __init__(self, max_wall_time: float = None, max_events: int = None, interval: float = 0.01):
+        if interval <= 0:
+            raise ValueError(f"The budget check interval {interval} should be larger than 0.")
+        self.max_wall_time = max_wall_time
+        self.max_events = max_events
+        self.interval = interval
+        self.reason = ""
+        self.wall_start = None
+
+    def attach(self, stop_time: float):
+        from .telemetry import schedule_periodic
+        self.wall_start = time.monotonic()
+        schedule_periodic(self.interval, self.check, stop_time)
+
+    def check(self):
+        if self.reason:
+            return
+        if self.max_wall_time is not None and time.monotonic() - self.wall_start > self.max_wall_time:
+            self.reason = f"wall time budget of {self.max_wall_time}s exhausted"
+        elif self.max_events is not None and ns.core.Simulator.GetEventCount() > self.max_events:
+            self.reason = f"event budget of {self.max_events} events exhausted"
+        if self.reason:
+            ns.core.Simulator.Stop()
+
+
+class SinkMonitor:
+    """
+    Application bytes every TCP sink of the rank received so far and the last time that grew,
+    polled every interval simulated seconds. The distributed simulator uses them for the receive
+    side of flows that cross ranks, see merge_flow_stats.
+    """
+    def __init__(self, sinks: dict, interval: float = 0.01):
+        self.sinks = sinks
+        self.interval = interval
+        self.progress = {name: (0, 0.0) for name in sinks}
+
+    def attach(self, stop_time: float):
+        from .telemetry import schedule_periodic
+        if self.sinks:
+            schedule_periodic(self.interval, self.poll, stop_time)
+
+    def poll(self):
+        now = ns.core.Simulator.Now().GetSeconds()
+        for name, sink in self.sinks.items():
+            rx = sink.GetTotalRx()
+            if rx > self.progress[name][0]:
+                self.progress[name] = (rx, now)
+
+
+def _is_column(value) -> bool:
+    return isinstance(value, (list, tuple, range)) or hasattr(value, "__array__")
+
+
 class Model:
     """
     > To run the basic function of the model:
@@ -30,35 +270,85 @@ class Model:
         mymodel.enable_PCAP(f"results/exp1.1-{TCPVersion.LinuxReno.name}-n5n7", "n5n7")
         mymodel.start()
         '''
+    > start() prints the FlowMonitor stats of every flow and returns them as a SimulationResult.
     > The topology of the Network is fixed and all nodes are DISABLED by default.
-    > Use the model.add_application function to enable certain nodes. They can be either TCP or
-      UDP class.
+    > Use the model.add_application function to enable certain nodes. They can be either TCP,
+      UDP or XPONG class, the last being the game protocol of lab2 (see XPongPeer). Large
+      numbers of flows are much faster to set up with model.add_applications. Finite TCP flows
+      of a given size, for flow completion times, use model.add_finite_flows.
     > The global TCP version is configured using the TCPVersion enum class, see example on top.
-    > Error on a specific link can be introduced using the add_error function.
+      Socket tuning (initial cwnd, SACK, min RTO, buffers, pacing...) comes from profile, by
+      default TcpProfile.for_version(tcp_version).
+    > Error on a specific link can be introduced using the add_error function, independent
+      per packet at netparams.error_rate or with a loss model of losses, e.g. bursts with
+      model.add_error("n1n6", GilbertElliott(p_good_bad=0.01, p_bad_good=0.2)).
     > All links can be accessed by typing n#1n#2, where #1 and #2 are the nodes the link
       connected with. For instance, n1n6. #1 will always be the number smaller than #2.
+    > With distributed=True the model runs on ns-3's distributed simulator, one partition per
+      MPI rank. Nodes are assigned to ranks by partition (node -> rank, see default_partition)
+      and links between ranks become remote channels. Run the script with
+      `mpirun -np N python3 sim.py`. Every rank builds the same model, applications and
+      captures are only installed on the rank owning the node, and rank 0 gathers the flow
+      stats of all ranks (requires mpi4py). start() returns None on the other ranks. The first
+      distributed Model initialises MPI and it is finalised at exit, so a script can run
+      several models one after the other.
+      FlowMonitor cannot follow packets across ranks, so TCP flows between nodes of different
+      ranks take their receive stats from their sinks, estimated from the application bytes
+      (see merge_flow_stats). The remaining crossing flows, TCP ACKs and UDP, only have
+      transmit stats and are returned in result.remote_flows, not in flows.
+    > model.start(max_wall_time=600, max_events=10**8) stops a runaway run early and returns
+      the stats collected so far, marked truncated.
+    > model.schedule(10, "n6n7", rate=250000) halves the bottleneck at 10s, up=False takes a
+      link down and error_rate changes its loss. With model.enable_throughput_sampling() the
+      result holds the throughput of every flow over time, see events.recovery_time.
+    > ECN: model.add_marking_queue("n6n7", k=20) puts a RED step-marking queue on the link and
+      turns on ECN in the model's TCP sockets, which TCPVersion.Dctcp needs to work as intended.
+    > model.enable_triggered_capture(title, link) captures like enable_PCAP, but only keeps
+      the packets from before_ms before to after_ms after every drop on the link.
+    > model.enable_link_counters() samples traffic and drops of every link into matrices of
+      result.link_counters, to find the bottleneck without captures, see LinkCounters.
+    > Long runs can report their progress while Simulator.Run() executes with
+      model.enable_telemetry("results/progress.jsonl"), see Telemetry.
     """
     def __init__(
-            self, netparams = NetworkParams(), tcp_version: TCPVersion = TCPVersion.LinuxReno, verbose: bool = False
+            self, netparams = NetworkParams(), tcp_version: TCPVersion = TCPVersion.LinuxReno, verbose: bool = False,
+            distributed: bool = False, partition: dict = None, profile: TcpProfile = None
         ):
         self.netparams = netparams
         ns.core.RngSeedManager.SetSeed(42)
         if verbose:
             ns.core.LogComponentEnable(tcp_version.value, map_tcp_verbose(tcp_version))
 
+        self.distributed = distributed
+        self.rank, self.ranks = 0, 1
+        if distributed:
+            from ns import mpi
+            ns.core.GlobalValue.Bind("SimulatorImplementationType",
+                                     ns.core.StringValue("ns3::DistributedSimulatorImpl"))
+            _enable_mpi()
+            self.rank = mpi.MpiInterface.GetSystemId()
+            self.ranks = mpi.MpiInterface.GetSize()
+        self.partition = partition if partition is not None else default_partition(self.ranks)
+        if any(not 0 <= self.partition.get(node, -1) < self.ranks for node in range(N_NODES)):
+            raise ValueError(f"The partition {self.partition} should map every node to one of {self.ranks} ranks.")
+
         self.nodes = ns.network.NodeContainer()
-        self.nodes.Create(8)
-
-        self.channels = {
-            "n0n5": self.create_channel(0, 5, self.nodes),
-            "n1n6": self.create_channel(1, 6, self.nodes),
-            "n2n6": self.create_channel(2, 6, self.nodes),
-            "n3n7": self.create_channel(3, 7, self.nodes),
-            "n4n7": self.create_channel(4, 7, self.nodes),
-            "n5n6": self.create_channel(5, 6, self.nodes),
-            "n5n7": self.create_channel(5, 7, self.nodes),
-            "n6n7": self.create_channel(6, 7, self.nodes),
-            }
+        for node in range(N_NODES):
+            self.nodes.Create(1, self.partition[node])
+
+        self.telemetry = None
+        self.sinks = set()
+        self.bulk_helpers = {}
+        self.events = []
+        self.link_error_models = {}
+        self.link_losses = {}
+        self.throughput_sampler = None
+        self.queue_monitor = None
+        self.captures = []
+        self.xpong_peers = []
+        self.tcp_sinks = {}
+        self.link_counters = None
+        self.channels = {name: self.create_channel(a, b, self.nodes) for name, (a, b) in LINKS.items()}
 
         self.pointToPoint = ns.point_to_point.PointToPointHelper()
         self.pointToPoint.SetDeviceAttribute("Mtu", ns.core.UintegerValue(1500))
@@ -69,8 +359,12 @@ class Model:
 
         self.p2p_links = {name: self.pointToPoint.Install(channel)
                     for name, channel in self.channels.items()}
-        
-        ns.core.Config.SetDefault("ns3::TcpSocket::SegmentSize", ns.core.UintegerValue(1448))
+
+        # Applied by start() right before the run, so models built side by side do not
+        # overwrite each other's socket defaults.
+        self.tcp_version = tcp_version
+        self.profile = profile if profile is not None else TcpProfile.for_version(tcp_version)
+        self.profile.validate(tcp_version)
         ns.core.Config.SetDefault("ns3::TcpL4Protocol::SocketType",
                                   ns.core.StringValue(f"ns3::{tcp_version.value}"))
 
@@ -86,34 +380,341 @@ class Model:
 
         ns.internet.Ipv4GlobalRoutingHelper.PopulateRoutingTables()
 
-        if netparams.error_rate > 0:
-            self.error_model = ns.network.RateErrorModel()
-            self.error_model.SetAttribute("ErrorUnit", ns.core.StringValue("ERROR_UNIT_PACKET"))
-            self.error_model.SetAttribute("ErrorRate", ns.core.DoubleValue(netparams.error_rate))
-
 
-    def add_error(self, p2p_link: str):
-        if self.netparams.error_rate <= 0:
+    def add_error(self, p2p_link: str, loss = None):
+        """
+        Lose packets received on p2p_link (a -> b) according to loss, a losses.RateLoss,
+        GilbertElliott or DropList. By default RateLoss(netparams.error_rate). Every link gets its
+        own error model with its own random stream.
+        """
+        from .losses import GilbertElliott, RateLoss
+        if loss is None:
+            if self.netparams.error_rate <= 0:
+                raise ValueError(
+                    f"The error rate {self.netparams.error_rate} should be larger than 0 to introduce error.")
+            loss = RateLoss(self.netparams.error_rate)
+        loss.validate()
+        if not isinstance(loss, RateLoss) and any(event.link == p2p_link and event.error_rate is not None
+                                                  for event in self.events):
+            raise ValueError(_scheduled_error_rate_conflict(p2p_link, loss))
+        if isinstance(loss, GilbertElliott) and any(event.link == p2p_link and event.rate is not None
+                                                    for event in self.events):
+            raise ValueError(_scheduled_rate_conflict(p2p_link))
+        error_model = loss.create(LINK_NAMES.index(p2p_link), self.netparams.rate, STOP_TIME)
+        self.p2p_links[p2p_link].Get(1).SetReceiveErrorModel(error_model)
+        self.link_losses[p2p_link] = loss
+        if isinstance(loss, RateLoss):
+            self.link_error_models[p2p_link] = error_model
+        else:
+            self.link_error_models.pop(p2p_link, None)
+
+
+    def schedule(self, time: float, link: str, rate: int = None, up: bool = None, error_rate: float = None):
+        """
+        Change link at time simulated seconds: its data rate (bits/s, both directions), whether it
+        is up (routes are recomputed around it while it is down), and/or its packet error rate.
+        A scheduled error rate changes the RateLoss of add_error on that link, or starts from no
+        loss if there is none; other loss models cannot be combined with it. A GilbertElliott loss
+        cannot be combined with a scheduled data rate either.
+        """
+        from .events import LinkEvent
+        from .losses import GilbertElliott, RateLoss
+        if link not in self.p2p_links:
+            raise ValueError(f"The link {link} should be one of {', '.join(self.p2p_links)}.")
+        if not 0 <= time < STOP_TIME:
+            raise ValueError(f"The event time {time} should be within [0, {STOP_TIME}).")
+        if rate is not None and rate <= 0:
+            raise ValueError(f"The data rate {rate} should be larger than 0.")
+        if error_rate is not None and not 0 <= error_rate <= 1:
+            raise ValueError(f"The error rate {error_rate} should be within [0, 1].")
+        if rate is None and up is None and error_rate is None:
+            raise ValueError("The event should change at least one of rate, up and error_rate.")
+        loss = self.link_losses.get(link)
+        if error_rate is not None and loss is not None and not isinstance(loss, RateLoss):
+            raise ValueError(_scheduled_error_rate_conflict(link, loss))
+        if rate is not None and isinstance(loss, GilbertElliott):
+            raise ValueError(_scheduled_rate_conflict(link))
+        if up is not None and self.link_counters is not None and self.link_counters.receive:
+            raise ValueError(_link_down_conflict("link counters"))
+        if up is not None and self.captures:
+            raise ValueError(_link_down_conflict("triggered captures"))
+
+        if error_rate is not None and link not in self.link_error_models:
+            error_model = ns.network.RateErrorModel()
+            error_model.SetAttribute("ErrorUnit", ns.core.StringValue("ERROR_UNIT_PACKET"))
+            error_model.SetAttribute("ErrorRate", ns.core.DoubleValue(0.0))
+            error_model.AssignStreams(LINK_NAMES.index(link))
+            self.p2p_links[link].Get(1).SetReceiveErrorModel(error_model)
+            self.link_error_models[link] = error_model
+
+        event = LinkEvent(time, link, rate, up, error_rate)
+        self.events.append(event)
+        ns.core.Simulator.Schedule(ns.core.Seconds(time), self.apply_event, event)
+
+
+    def apply_event(self, event):
+        devices = self.p2p_links[event.link]
+        if event.rate is not None:
+            for i in range(devices.GetN()):
+                devices.Get(i).SetAttribute("DataRate",
+                                    ns.network.DataRateValue(ns.network.DataRate(int(event.rate))))
+        if event.error_rate is not None:
+            self.link_error_models[event.link].SetAttribute("ErrorRate", ns.core.DoubleValue(event.error_rate))
+        if event.up is not None:
+            for i in range(devices.GetN()):
+                device = devices.Get(i)
+                ipv4 = device.GetNode().GetObject(ns.internet.Ipv4.GetTypeId())
+                interface = ipv4.GetInterfaceForDevice(device)
+                if event.up:
+                    ipv4.SetUp(interface)
+                else:
+                    ipv4.SetDown(interface)
+            ns.internet.Ipv4GlobalRoutingHelper.RecomputeRoutingTables()
+
+
+    def add_marking_queue(self, link: str, k: int = 20, min_th: int = None, max_th: int = None,
+                          limit: int = 1000, ecn: bool = True):
+        """
+        Replace the default queue discs of both directions of link by RED, in packets. By default
+        min_th = max_th = k with an instantaneous queue (QW=1) and without RED's gentle ramp
+        above max_th, i.e. the step marking at K of DCTCP. With ecn the packets are marked
+        instead of dropped and the model's TCP sockets negotiate ECN (TcpProfile.ecn);
+        otherwise RED drops early.
+        Marks and drops end up in result.queues, which also counts the marks and drops of a
+        step queue below K ("unforced", should stay 0).
+        """
+        min_th = k if min_th is None else min_th
+        max_th = k if max_th is None else max_th
+        if not 0 < min_th <= max_th < limit:
             raise ValueError(
-                f"The error rate {self.netparams.error_rate} should be larger than 0 to introduce error.")
-        self.p2p_links[p2p_link].Get(1).SetReceiveErrorModel(self.error_model)
+                f"The thresholds should satisfy 0 < min_th ({min_th}) <= max_th ({max_th}) < limit ({limit}).")
+        if self.distributed:
+            raise ValueError("Marking queues are not supported by the distributed simulator.")
+        from .queues import QueueMonitor, queue_name
+        if ecn:
+            self.profile = replace(self.profile, ecn=True)
+
+        devices = self.p2p_links[link]
+        traffic_control = ns.traffic_control.TrafficControlHelper()
+        traffic_control.Uninstall(devices)
+        traffic_control.SetRootQueueDisc("ns3::RedQueueDisc",
+                                "MaxSize", ns.network.QueueSizeValue(ns.network.QueueSize(f"{limit}p")),
+                                "MinTh", ns.core.DoubleValue(min_th),
+                                "MaxTh", ns.core.DoubleValue(max_th),
+                                "QW", ns.core.DoubleValue(1.0),
+                                "MeanPktSize", ns.core.UintegerValue(1500),
+                                "UseEcn", ns.core.BooleanValue(ecn),
+                                "UseHardDrop", ns.core.BooleanValue(False),
+                                "Gentle", ns.core.BooleanValue(False),
+                                "LinkBandwidth", ns.network.DataRateValue(ns.network.DataRate(int(self.netparams.rate))),
+                                "LinkDelay", ns.core.TimeValue(ns.core.MilliSeconds(int(self.netparams.latency_ms))))
+        queue_discs = traffic_control.Install(devices)
+
+        if self.queue_monitor is None:
+            self.queue_monitor = QueueMonitor()
+        a, b = LINKS[link]
+        self.queue_monitor.add(queue_name(a, b), queue_discs.Get(0), step=min_th == max_th)
+        self.queue_monitor.add(queue_name(b, a), queue_discs.Get(1), step=min_th == max_th)
 
 
     def add_application(self, src_node: int, dst_node: int, dst_addr: str, start_time, stop_time, type: str, port: int):
         setup_application = {"TCP": self.SetupTcpConnection,
-                            "UDP": self.SetupUdpConnection}
+                            "UDP": self.SetupUdpConnection,
+                            "XPONG": self.SetupXPong}
         setup_application[type](self.nodes.Get(src_node), self.nodes.Get(dst_node), self.ip_address[dst_addr].GetAddress(0), ns.core.Seconds(start_time), ns.core.Seconds(stop_time), port)
 
 
+    def add_applications(self, src_nodes, dst_nodes, dst_addrs, start_times, stop_times, types, ports,
+                         port_block: int = None):
+        """
+        Bulk version of add_application for thousands of flows. Every argument is a sequence with
+        one entry per flow, or a single value shared by all flows. Flows to the same destination
+        node and port share one sink, and flows with the same destination, port and start/stop
+        times are installed with one helper call on a NodeContainer of their sources.
+        > Batching only pays off when flows share those keys. With a port per flow every flow
+          still gets its own sink and client install. port_block maps every block of port_block
+          consecutive TCP ports (port // port_block) onto one sink on the first port of the
+          block; its clients all connect there and differ only in their source ports. Setup then grows
+          with the number of blocks and distinct start/stop times instead of the flows, but
+          FlowStats.destination_port is the block port, so match_flows no longer tells flows apart.
+        """
+        columns = [src_nodes, dst_nodes, dst_addrs, start_times, stop_times, types, ports]
+        n = max((len(column) for column in columns if _is_column(column)), default=1)
+        columns = [column if _is_column(column) else [column] * n for column in columns]
+        if any(len(column) != n for column in columns):
+            raise ValueError("Every column of add_applications should have one entry per flow.")
+        if port_block is not None and port_block < 1:
+            raise ValueError(f"The port block {port_block} should be at least 1.")
+
+        sinks, clients = {}, {}
+        for src, dst, dst_addr, start, stop, type, port in zip(*columns):
+            if type == "XPONG":
+                self.add_application(int(src), int(dst), dst_addr, start, stop, type, int(port))
+                continue
+            if type not in ("TCP", "UDP"):
+                raise ValueError(f"The application type {type} should be TCP, UDP or XPONG.")
+            src, dst, port = int(src), int(dst), int(port)
+            if type == "TCP" and port_block:
+                port -= port % port_block
+            sinks.setdefault((type, 9 if type == "UDP" else port), set()).add(dst)
+            clients.setdefault((type, dst_addr, port, float(start), float(stop)), []).append(src)
+
+        for (type, port), dsts in sinks.items():
+            container = ns.network.NodeContainer()
+            for dst in sorted(dsts):
+                if (type, dst, port) not in self.sinks and self.is_local(self.nodes.Get(dst)):
+                    self.sinks.add((type, dst, port))
+                    container.Add(self.nodes.Get(dst))
+            if container.GetN():
+                sink_apps = self.bulk_helper(type, "sink", port).Install(container)
+                sink_apps.Start(ns.core.Seconds(1.0))
+                sink_apps.Stop(ns.core.Seconds(STOP_TIME))
+                if type == "TCP":
+                    for i in range(container.GetN()):
+                        self.tcp_sinks[f"n{container.Get(i).GetId()}:{port}"] = sink_apps.Get(i)
+
+        for (type, dst_addr, port, start, stop), srcs in clients.items():
+            container = ns.network.NodeContainer()
+            for src in srcs:
+                if self.is_local(self.nodes.Get(src)):
+                    container.Add(self.nodes.Get(src))
+            if not container.GetN():
+                continue
+            helper = self.bulk_helper(type, "client")
+            address = self.ip_address[dst_addr].GetAddress(0)
+            if type == "TCP":
+                helper.SetAttribute("Remote", ns.network.AddressValue(
+                                        ns.network.Address(ns.network.InetSocketAddress(address, port))))
+            else:
+                helper.SetAttribute("RemoteAddress", ns.network.AddressValue(ns.network.Address(address)))
+                helper.SetAttribute("RemotePort", ns.core.UintegerValue(port))
+            client_apps = helper.Install(container)
+            client_apps.Start(ns.core.Seconds(start))
+            client_apps.Stop(ns.core.Seconds(stop))
+
+
+    def add_finite_flows(self, src_nodes, dst_nodes, dst_addrs, start_times, sizes, ports):
+        """
+        TCP flows that each send a fixed number of bytes with BulkSend and then close, e.g. for
+        flow completion times (see workload.Workload). Columns as in add_applications.
+        > The application bytes every sink received end up in result.sink_rx, so a flow with a
+          port of its own can be checked for completion against its size. Such flows cost a
+          sink and a client install each; only flows that share destination, port, start time
+          and size are installed together.
+        """
+        if self.distributed:
+            raise ValueError("Finite flows are not supported by the distributed simulator.")
+        columns = [src_nodes, dst_nodes, dst_addrs, start_times, sizes, ports]
+        n = max((len(column) for column in columns if _is_column(column)), default=1)
+        columns = [column if _is_column(column) else [column] * n for column in columns]
+        if any(len(column) != n for column in columns):
+            raise ValueError("Every column of add_finite_flows should have one entry per flow.")
+
+        sinks, clients = {}, {}
+        for src, dst, dst_addr, start, size, port in zip(*columns):
+            if size <= 0:
+                raise ValueError(f"The flow size {size} should be larger than 0 bytes.")
+            src, dst, port = int(src), int(dst), int(port)
+            sinks.setdefault(port, set()).add(dst)
+            clients.setdefault((dst_addr, port, float(start), int(size)), []).append(src)
+
+        for port, dsts in sinks.items():
+            container = ns.network.NodeContainer()
+            for dst in sorted(dsts):
+                if ("TCP", dst, port) not in self.sinks and self.is_local(self.nodes.Get(dst)):
+                    self.sinks.add(("TCP", dst, port))
+                    container.Add(self.nodes.Get(dst))
+            if container.GetN():
+                sink_apps = self.bulk_helper("TCP", "sink", port).Install(container)
+                sink_apps.Start(ns.core.Seconds(0.0))
+                sink_apps.Stop(ns.core.Seconds(STOP_TIME))
+                for i in range(container.GetN()):
+                    self.tcp_sinks[f"n{container.Get(i).GetId()}:{port}"] = sink_apps.Get(i)
+
+        helper = self.bulk_helper("BULK", "client")
+        for (dst_addr, port, start, size), srcs in clients.items():
+            container = ns.network.NodeContainer()
+            for src in srcs:
+                if self.is_local(self.nodes.Get(src)):
+                    container.Add(self.nodes.Get(src))
+            if not container.GetN():
+                continue
+            address = self.ip_address[dst_addr].GetAddress(0)
+            helper.SetAttribute("Remote", ns.network.AddressValue(
+                                    ns.network.Address(ns.network.InetSocketAddress(address, port))))
+            helper.SetAttribute("MaxBytes", ns.core.UintegerValue(size))
+            client_apps = helper.Install(container)
+            client_apps.Start(ns.core.Seconds(start))
+            client_apps.Stop(ns.core.Seconds(STOP_TIME))
+
+
+    def bulk_helper(self, type: str, role: str, port: int = 0):
+        """
+        The helpers of add_applications, configured once per model and reused for every flow.
+        A sink helper is set to listen on port before it is returned.
+        """
+        key = (type, role)
+        if key not in self.bulk_helpers:
+            self.bulk_helpers[key] = self.create_helper(type, role)
+        helper = self.bulk_helpers[key]
+        if key == ("TCP", "sink"):
+            helper.SetAttribute("Local", ns.network.AddressValue(
+                                    ns.network.Address(ns.network.InetSocketAddress(ns.network.Ipv4Address.GetAny(), port))))
+        elif key == ("UDP", "sink"):
+            helper.SetAttribute("Port", ns.core.UintegerValue(port))
+        return helper
+
+
+    def create_helper(self, type: str, role: str):
+        if (type, role) == ("TCP", "sink"):
+            helper = ns.applications.PacketSinkHelper("ns3::TcpSocketFactory",
+                                ns.network.InetSocketAddress(ns.network.Ipv4Address.GetAny(), 0))
+        elif (type, role) == ("UDP", "sink"):
+            helper = ns.applications.UdpEchoServerHelper(0)
+        elif type == "BULK":
+            helper = ns.applications.BulkSendHelper("ns3::TcpSocketFactory",
+                                ns.network.Address(ns.network.InetSocketAddress(ns.network.Ipv4Address.GetAny(), 0)))
+        elif type == "TCP":
+            helper = ns.applications.OnOffHelper("ns3::TcpSocketFactory",
+                                ns.network.Address(ns.network.InetSocketAddress(ns.network.Ipv4Address.GetAny(), 0)))
+            helper.SetAttribute("DataRate",
+                                ns.network.DataRateValue(ns.network.DataRate(int(self.netparams.on_off_rate))))
+            helper.SetAttribute("PacketSize", ns.core.UintegerValue(1500))
+            helper.SetAttribute("OnTime", ns.core.StringValue("ns3::ConstantRandomVariable[Constant=2]"))
+            helper.SetAttribute("OffTime", ns.core.StringValue("ns3::ConstantRandomVariable[Constant=1]"))
+        else:
+            helper = ns.applications.UdpEchoClientHelper(ns.network.Ipv4Address.GetAny(), 0)
+            helper.SetAttribute("MaxPackets", ns.core.UintegerValue(1000))
+            helper.SetAttribute("Interval", ns.core.TimeValue(ns.core.Seconds(0.01)))
+            helper.SetAttribute("PacketSize", ns.core.UintegerValue(1024))
+        return helper
+
+
+    def is_local(self, node) -> bool:
+        return node.GetSystemId() == self.rank
+
+
     def SetupTcpConnection(self, srcNode, dstNode, dstAddr, startTime, stopTime, port: int):
-        # Create a TCP sink at dstNode
+        # Create a TCP sink at dstNode, unless add_applications or an earlier flow already did
+        if self.is_local(dstNode) and ("TCP", dstNode.GetId(), port) not in self.sinks:
+            self.sinks.add(("TCP", dstNode.GetId(), port))
+            self.InstallTcpSink(dstNode, port)
+
+        if self.is_local(srcNode):
+            self.InstallTcpClient(srcNode, dstAddr, startTime, stopTime, port)
+
+
+    def InstallTcpSink(self, dstNode, port: int):
         packet_sink_helper = ns.applications.PacketSinkHelper("ns3::TcpSocketFactory",
                                 ns.network.InetSocketAddress(ns.network.Ipv4Address.GetAny(),
                                                             port))
         sink_apps = packet_sink_helper.Install(dstNode)
         sink_apps.Start(ns.core.Seconds(1.0))
-        sink_apps.Stop(ns.core.Seconds(60.0))
+        sink_apps.Stop(ns.core.Seconds(STOP_TIME))
+        self.tcp_sinks[f"n{dstNode.GetId()}:{port}"] = sink_apps.Get(0)
+
 
+    def InstallTcpClient(self, srcNode, dstAddr, startTime, stopTime, port: int):
         # Create TCP connection from srcNode to dstNode
         on_off_tcp_helper = ns.applications.OnOffHelper("ns3::TcpSocketFactory",
                                 ns.network.Address(ns.network.InetSocketAddress(dstAddr, port)))
@@ -134,11 +735,16 @@ class Model:
 
 
     def SetupUdpConnection(self, srcNode, dstNode, dstAddr, startTime, stopTime, port: int):
-        # Create a UDP sink at dstNode
-        echoServer = ns.applications.UdpEchoServerHelper(9)
-        serverApps = echoServer.Install(dstNode)
-        serverApps.Start(ns.core.Seconds(1.0))
-        serverApps.Stop(ns.core.Seconds(60.0))
+        # Create a UDP sink at dstNode, one echo server on port 9 serves every flow
+        if self.is_local(dstNode) and ("UDP", dstNode.GetId(), 9) not in self.sinks:
+            self.sinks.add(("UDP", dstNode.GetId(), 9))
+            echoServer = ns.applications.UdpEchoServerHelper(9)
+            serverApps = echoServer.Install(dstNode)
+            serverApps.Start(ns.core.Seconds(1.0))
+            serverApps.Stop(ns.core.Seconds(STOP_TIME))
+
+        if not self.is_local(srcNode):
+            return
 
         # Create UDP client at srcNode
         # Unlike TCP, no need to establish a connection before data transmission
@@ -155,39 +761,178 @@ class Model:
         clientApps.Start(startTime)
         clientApps.Stop(stopTime)
 
-    def enable_PCAP(self, title: str, link: str):
-        self.pointToPoint.EnablePcap(title, self.p2p_links[link].Get(0), True)
+    def SetupXPong(self, srcNode, dstNode, dstAddr, startTime, stopTime, port: int):
+        # Player 0 on srcNode and player 1 on dstNode, both on port, see XPongPeer
+        from .topology import source_address
+        from .xpong import XPongPeer
+        if self.distributed:
+            raise ValueError("XPong is not supported by the distributed simulator.")
+        start, stop = startTime.GetSeconds(), min(stopTime.GetSeconds(), STOP_TIME)
+        players = [XPongPeer(srcNode, port, 0, start, stop), XPongPeer(dstNode, port, 1, start, stop)]
+        srcAddr = ns.network.Ipv4Address(source_address(srcNode.GetId(), dstNode.GetId()))
+        players[0].install(dstAddr)
+        players[1].install(srcAddr)
+        self.xpong_peers.extend(players)
 
+    def enable_PCAP(self, title: str, link: str):
+        device = self.p2p_links[link].Get(0)
+        if self.is_local(device.GetNode()):
+            self.pointToPoint.EnablePcap(title, device, True)
+
+
+    def enable_triggered_capture(self, title: str, link: str, before_ms: float = 50, after_ms: float = 50,
+                                 dip: float = None, interval: float = 0.01):
+        """
+        Capture link like enable_PCAP on its first device, then keep only the packets around
+        drops and throughput dips. The full capture is still written during the run, only
+        filtered afterwards, see TriggeredCapture.
+        """
+        from .capture import TriggeredCapture
+        if self.distributed:
+            raise ValueError("Triggered captures are not supported by the distributed simulator.")
+        if any(event.up is not None for event in self.events):
+            raise ValueError(_link_down_conflict("triggered captures"))
+        capture = TriggeredCapture(title, link, before_ms, after_ms, dip, interval)
+        self.captures.append(capture)
+        return capture
+
+
+    def enable_link_counters(self, interval: float = 0.1, receive: bool = True):
+        from .counters import LinkCounters
+        if self.distributed:
+            raise ValueError("Link counters are not supported by the distributed simulator.")
+        if receive and any(event.up is not None for event in self.events):
+            raise ValueError(_link_down_conflict("link counters"))
+        self.link_counters = LinkCounters(interval, receive)
+
+
+    def enable_telemetry(self, path: str = None, address: tuple = None, interval: float = 1.0, label: str = None):
+        from .telemetry import Telemetry
+        if label is not None and self.distributed:
+            label = f"{label}-rank{self.rank}"
+        self.telemetry = Telemetry(path, address, interval, label)
+
+
+    def enable_throughput_sampling(self, interval: float = 0.1):
+        from .events import ThroughputSampler
+        if self.distributed:
+            raise ValueError("Throughput sampling is not supported by the distributed simulator.")
+        self.throughput_sampler = ThroughputSampler(interval)
+
+
+    def start(self, max_wall_time: float = None, max_events: int = None):
+        """
+        Run the simulation. With max_wall_time (seconds) or max_events the run is stopped early
+        once either budget is used up; the flow stats up to that point are still collected and
+        the result is marked truncated.
+        """
+        budget = None
+        if max_wall_time is not None or max_events is not None:
+            if self.distributed:
+                raise ValueError("Run budgets are not supported by the distributed simulator.")
+            budget = Budget(max_wall_time, max_events)
+            budget.attach(STOP_TIME)
 
-    def start(self):
         flowmon_helper = ns.flow_monitor.FlowMonitorHelper()
         monitor = flowmon_helper.InstallAll()
-        ns.core.Simulator.Stop(ns.core.Seconds(60.0))
+        if self.telemetry is not None:
+            self.telemetry.attach(monitor, flowmon_helper.GetClassifier(), STOP_TIME)
+        if self.throughput_sampler is not None:
+            self.throughput_sampler.attach(monitor, STOP_TIME)
+        if self.queue_monitor is not None:
+            self.queue_monitor.attach(STOP_TIME)
+        for capture in self.captures:
+            # The longest a packet is on the wire: a full-size PPP frame at the slowest rate of the link.
+            rate = min([self.netparams.rate] + [event.rate for event in self.events
+                                                if event.link == capture.link and event.rate is not None])
+            delay = self.netparams.latency_ms / 1000 + 1502 * 8 / rate
+            capture.attach(self.pointToPoint, self.p2p_links[capture.link], monitor,
+                           flowmon_helper.GetClassifier(), delay, STOP_TIME)
+        if self.link_counters is not None:
+            self.link_counters.attach(self.p2p_links, monitor, flowmon_helper.GetClassifier(), STOP_TIME)
+        sink_monitor = None
+        if self.distributed:
+            sink_monitor = SinkMonitor(self.tcp_sinks)
+            sink_monitor.attach(STOP_TIME)
+        self.profile.apply(self.tcp_version)
+        ns.core.Simulator.Stop(ns.core.Seconds(STOP_TIME))
         ns.core.Simulator.Run()
+        sim_time = ns.core.Simulator.Now().GetSeconds()
+        if self.telemetry is not None:
+            self.telemetry.close()
 
         monitor.CheckForLostPackets()
-
-        classifier = flowmon_helper.GetClassifier()
-
+        flows = self.collect_flow_stats(monitor, flowmon_helper.GetClassifier())
+        queue_stats = None
+        if self.queue_monitor is not None:
+            queue_stats = self.queue_monitor.stats()
+        sink_rx = {name: sink.GetTotalRx() for name, sink in self.tcp_sinks.items()}
+        ns.core.Simulator.Destroy()
+        if self.xpong_peers:
+            # Drop the payloads of the packets still in flight at the end, they are keyed by
+            # packet uids the next model reuses.
+            self.xpong_peers[0].payloads.clear()
+        captures = {capture.path: capture.close() for capture in self.captures}
+
+        remote_flows = None
+        if self.distributed:
+            flows, remote_flows, sink_rx = self.gather_flow_stats(flows, sink_monitor.progress)
+            if self.rank != 0:
+                return None
+
+        result = SimulationResult(flows, sim_time, remote_flows=remote_flows)
+        if budget is not None and budget.reason:
+            result.truncated = True
+            result.truncation_reason = budget.reason
+        if self.throughput_sampler is not None:
+            result.throughput_times, result.throughput = self.throughput_sampler.throughput(
+                                                                [flow.flow_id for flow in flows])
+        if self.queue_monitor is not None:
+            result.queues = queue_stats
+        if self.captures:
+            result.captures = captures
+        if self.link_counters is not None:
+            result.link_times, result.link_counters = self.link_counters.matrices()
+        if sink_rx:
+            result.sink_rx = sink_rx
+        if self.xpong_peers:
+            result.xpong = {f"n{peer.node.GetId()}:{peer.port}": peer.stats() for peer in self.xpong_peers}
+        result.print_flows()
+        return result
+
+
+    def collect_flow_stats(self, monitor, classifier) -> list:
+        flows = []
         for flow_id, flow_stats in monitor.GetFlowStats():
             t = classifier.FindFlow(flow_id)
-            proto = {6: 'TCP', 17: 'UDP'} [t.protocol]
-            print ("FlowID: %i (%s %s/%s --> %s/%i)" %
-                    (flow_id, proto, t.sourceAddress, t.sourcePort, t.destinationAddress, t.destinationPort))
-
-            print ("  Tx Bytes: %i" % flow_stats.txBytes)
-            print ("  Rx Bytes: %i" % flow_stats.rxBytes)
-            print ("  Lost Pkt: %i" % flow_stats.lostPackets)
-            print ("  Flow active: %fs - %fs" % (flow_stats.timeFirstTxPacket.GetSeconds(),
-                                                flow_stats.timeLastRxPacket.GetSeconds()))
-            print ("  Throughput: %f Mbps" % (flow_stats.rxBytes *
-                                                8.0 /
-                                                (flow_stats.timeLastRxPacket.GetSeconds()
-                                                - flow_stats.timeFirstTxPacket.GetSeconds())/
-                                                1024/
-                                                1024))
-        
-        ns.core.Simulator.Destroy()
+            flows.append(FlowStats(flow_id=flow_id,
+                                   protocol={6: 'TCP', 17: 'UDP'} [t.protocol],
+                                   source=str(t.sourceAddress),
+                                   source_port=t.sourcePort,
+                                   destination=str(t.destinationAddress),
+                                   destination_port=t.destinationPort,
+                                   tx_bytes=flow_stats.txBytes,
+                                   rx_bytes=flow_stats.rxBytes,
+                                   tx_packets=flow_stats.txPackets,
+                                   rx_packets=flow_stats.rxPackets,
+                                   lost_packets=flow_stats.lostPackets,
+                                   first_tx=flow_stats.timeFirstTxPacket.GetSeconds(),
+                                   last_rx=flow_stats.timeLastRxPacket.GetSeconds()))
+        return flows
+
+
+    def gather_flow_stats(self, flows: list, sinks: dict) -> tuple:
+        # mpi4py must not initialise MPI itself, ns-3 already did in MpiInterface.Enable.
+        import mpi4py
+        mpi4py.rc.initialize = False
+        mpi4py.rc.finalize = False
+        from mpi4py import MPI
+
+        per_rank = MPI.COMM_WORLD.gather((flows, sinks), root=0)
+        if self.rank != 0:
+            return [], [], {}
+        sink_rx = {name: rx for _, rank_sinks in per_rank for name, (rx, _) in rank_sinks.items()}
+        return (*merge_flow_stats(per_rank, self.partition, self.profile), sink_rx)
 
     def create_channel(self, a: int, b: int, nodes):
         channel = ns.network.NodeContainer()
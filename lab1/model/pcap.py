@@ -0,0 +1,149 @@
+import struct
+from dataclasses import dataclass
+
+
+# Link types written by ns-3 helpers. PointToPointHelper.EnablePcap uses PPP.
+DLT_EN10MB  = 1
+DLT_PPP     = 9
+DLT_RAW     = 101
+
+GLOBAL_HEADER_LEN = 24
+RECORD_HEADER_LEN = 16
+
+_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+
+
+@dataclass(frozen=True)
+class FiveTuple:
+    proto: int
+    src: str
+    sport: int
+    dst: str
+    dport: int
+
+    def __str__(self):
+        return f"{self.proto} {self.src}/{self.sport} --> {self.dst}/{self.dport}"
+
+
+@dataclass
+class PcapRecord:
+    offset: int
+    time: float
+    caplen: int
+    origlen: int
+    data: bytes
+
+
+class PcapReader:
+    """
+    > Minimal reader for the classic libpcap format written by enable_PCAP.
+    > Records can be iterated from any record boundary, which is what the sidecar index
+      and the batch analysis rely on to skip to the interesting part of a capture.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        header = self.file.read(GLOBAL_HEADER_LEN)
+        if len(header) < GLOBAL_HEADER_LEN or header[:4] not in _MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} is not a pcap file.")
+        self.endian, self.resolution = _MAGIC[header[:4]]
+        self.header = header
+        self.snaplen, self.linktype = struct.unpack(self.endian + "II", header[16:24])
+        self._record = struct.Struct(self.endian + "IIII")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def records(self, start: int = GLOBAL_HEADER_LEN, end: int = None, chunk_size: int = 1 << 20):
+        """Yield every complete record between the byte offsets start and end."""
+        self.file.seek(start)
+        buffer = b""
+        base = start
+        pos = 0
+        while True:
+            if len(buffer) - pos < RECORD_HEADER_LEN or not self._complete(buffer, pos):
+                if end is not None and base + pos >= end:
+                    return
+                chunk = self.file.read(chunk_size)
+                if not chunk:
+                    return
+                buffer = buffer[pos:] + chunk
+                base += pos
+                pos = 0
+                continue
+            offset = base + pos
+            if end is not None and offset >= end:
+                return
+            sec, frac, caplen, origlen = self._record.unpack_from(buffer, pos)
+            data = buffer[pos + RECORD_HEADER_LEN:pos + RECORD_HEADER_LEN + caplen]
+            pos += RECORD_HEADER_LEN + caplen
+            yield PcapRecord(offset, sec + frac * self.resolution, caplen, origlen, data)
+
+    def read_at(self, offset: int) -> PcapRecord:
+        self.file.seek(offset)
+        header = self.file.read(RECORD_HEADER_LEN)
+        if len(header) < RECORD_HEADER_LEN:
+            raise EOFError(f"No record at offset {offset} in {self.path}.")
+        sec, frac, caplen, origlen = self._record.unpack(header)
+        data = self.file.read(caplen)
+        if len(data) < caplen:
+            raise EOFError(f"Truncated record at offset {offset} in {self.path}.")
+        return PcapRecord(offset, sec + frac * self.resolution, caplen, origlen, data)
+
+    def _complete(self, buffer: bytes, pos: int) -> bool:
+        caplen = self._record.unpack_from(buffer, pos)[2]
+        return len(buffer) - pos >= RECORD_HEADER_LEN + caplen
+
+
+def ip_offset(linktype: int, data: bytes):
+    """Return the offset of the IPv4 header inside a frame, or None for anything else."""
+    if linktype == DLT_PPP:
+        return 2 if data[:2] == b"\x00\x21" else None
+    if linktype == DLT_EN10MB:
+        return 14 if data[12:14] == b"\x08\x00" else None
+    if linktype == DLT_RAW:
+        return 0
+    raise ValueError(f"Unsupported pcap link type {linktype}.")
+
+
+def five_tuple(linktype: int, data: bytes):
+    """Return the FiveTuple of an IPv4 TCP/UDP frame, or None for anything else."""
+    ip = ip_offset(linktype, data)
+    if ip is None or len(data) < ip + 20 or data[ip] >> 4 != 4:
+        return None
+    proto = data[ip + 9]
+    l4 = ip + (data[ip] & 0x0f) * 4
+    if proto not in (6, 17) or len(data) < l4 + 4:
+        return None
+    sport, dport = struct.unpack_from("!HH", data, l4)
+    return FiveTuple(proto, _ipv4(data, ip + 12), sport, _ipv4(data, ip + 16), dport)
+
+
+def _ipv4(data: bytes, offset: int) -> str:
+    return ".".join(str(b) for b in data[offset:offset + 4])
+
+
+def tcp_segment(linktype: int, data: bytes):
+    """Return (seq, ack, flags, payload length) of an IPv4 TCP frame, or None for anything else."""
+    ip = ip_offset(linktype, data)
+    if ip is None or len(data) < ip + 20 or data[ip + 9] != 6:
+        return None
+    ip_len = (data[ip] & 0x0f) * 4
+    total_len = struct.unpack_from("!H", data, ip + 2)[0]
+    l4 = ip + ip_len
+    if len(data) < l4 + 14:
+        return None
+    seq, ack, offset, flags = struct.unpack_from("!IIBB", data, l4 + 4)
+    return seq, ack, flags, total_len - ip_len - (offset >> 4) * 4
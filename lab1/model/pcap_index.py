@@ -0,0 +1,181 @@
+import os
+import socket
+import struct
+
+import numpy as np
+
+from .pcap import GLOBAL_HEADER_LEN, RECORD_HEADER_LEN, FiveTuple, PcapReader, five_tuple
+
+
+INDEX_VERSION = 1
+NO_FLOW = np.iinfo(np.uint32).max
+
+
+class PcapIndex:
+    """
+    > Sidecar index for a capture written by Model.enable_PCAP, so a time window or a single
+      flow can be read without scanning the whole file:
+        '''
+        index = PcapIndex.open("results/exp1.1-LinuxReno-n1n6-1-0.pcap")
+        for record in index.time_range(10, 12):
+            ...
+        for record in index.flow(index.flows()[0]):
+            ...
+        '''
+    > The index is stored next to the capture as <capture>.idx and holds the byte offset of
+      every record, the first record of every time bucket and the 5-tuple of every record.
+    > PcapIndex.open reuses an existing sidecar and only indexes the records appended since
+      it was written. A capture that was replaced or truncated is indexed from scratch.
+    > Records are assumed to be in time order, which is how ns-3 writes them.
+    """
+    def __init__(self, path: str, bucket: float = 0.1):
+        if bucket <= 0:
+            raise ValueError(f"The time bucket {bucket} should be larger than 0.")
+        self.path = path
+        self.bucket = bucket
+        self._reset()
+
+    def _reset(self):
+        self.header = b""
+        self.indexed_size = GLOBAL_HEADER_LEN
+        self.offsets = np.zeros(0, dtype=np.uint64)
+        self.flow_ids = np.zeros(0, dtype=np.uint32)
+        self.bucket_ids = np.zeros(0, dtype=np.int64)
+        self.bucket_first = np.zeros(0, dtype=np.int64)
+        self.flow_table = []
+        self._flow_lookup = {}
+        self._flow_order = None
+        self._flow_ptr = None
+
+    @staticmethod
+    def sidecar_path(path: str) -> str:
+        return f"{path}.idx"
+
+    @classmethod
+    def open(cls, path: str, bucket: float = 0.1, save: bool = True):
+        """Load the sidecar of path if there is one, then index whatever was appended since."""
+        index = cls.load(path) if os.path.exists(cls.sidecar_path(path)) else None
+        if index is None or index.bucket != bucket:
+            index = cls(path, bucket)
+        if index.update() and save:
+            index.save()
+        return index
+
+    @classmethod
+    def load(cls, path: str):
+        with open(cls.sidecar_path(path), "rb") as f:
+            data = np.load(f)
+            if int(data["version"]) != INDEX_VERSION:
+                return None
+            index = cls(path, float(data["bucket"]))
+            index.header = data["header"].tobytes()
+            index.indexed_size = int(data["indexed_size"])
+            index.offsets = data["offsets"]
+            index.flow_ids = data["flow_ids"]
+            index.bucket_ids = data["bucket_ids"]
+            index.bucket_first = data["bucket_first"]
+            flows = data["flows"]
+        index.flow_table = [FiveTuple(int(proto), _ntoa(src), int(sport), _ntoa(dst), int(dport))
+                            for proto, src, sport, dst, dport in flows]
+        index._flow_lookup = {flow: i for i, flow in enumerate(index.flow_table)}
+        return index
+
+    def save(self):
+        flows = np.array([(f.proto, _aton(f.src), f.sport, _aton(f.dst), f.dport)
+                          for f in self.flow_table], dtype=np.uint32).reshape(-1, 5)
+        with open(self.sidecar_path(self.path), "wb") as f:
+            np.savez_compressed(f,
+                                version=INDEX_VERSION,
+                                bucket=self.bucket,
+                                header=np.frombuffer(self.header, dtype=np.uint8),
+                                indexed_size=self.indexed_size,
+                                offsets=self.offsets,
+                                flow_ids=self.flow_ids,
+                                bucket_ids=self.bucket_ids,
+                                bucket_first=self.bucket_first,
+                                flows=flows)
+
+    def update(self) -> bool:
+        """Index the records appended to the capture. Return True if anything changed."""
+        size = os.path.getsize(self.path)
+        with PcapReader(self.path) as reader:
+            if reader.header != self.header or size < self.indexed_size:
+                self._reset()
+                self.header = reader.header
+            if size == self.indexed_size:
+                return False
+
+            offsets, flow_ids, bucket_ids, bucket_first = [], [], [], []
+            last_bucket = self.bucket_ids[-1] if len(self.bucket_ids) else None
+            n = len(self.offsets)
+            end = self.indexed_size
+            for record in reader.records(self.indexed_size):
+                bucket_id = int(record.time // self.bucket)
+                if bucket_id != last_bucket:
+                    bucket_ids.append(bucket_id)
+                    bucket_first.append(n)
+                    last_bucket = bucket_id
+                offsets.append(record.offset)
+                flow_ids.append(self._flow_id(five_tuple(reader.linktype, record.data)))
+                end = record.offset + RECORD_HEADER_LEN + record.caplen
+                n += 1
+
+        changed = end != self.indexed_size
+        self.indexed_size = end
+        self.offsets = np.concatenate([self.offsets, np.array(offsets, dtype=np.uint64)])
+        self.flow_ids = np.concatenate([self.flow_ids, np.array(flow_ids, dtype=np.uint32)])
+        self.bucket_ids = np.concatenate([self.bucket_ids, np.array(bucket_ids, dtype=np.int64)])
+        self.bucket_first = np.concatenate([self.bucket_first, np.array(bucket_first, dtype=np.int64)])
+        self._flow_order = None
+        return changed
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def flows(self):
+        return list(self.flow_table)
+
+    def time_range(self, start: float, stop: float):
+        """Yield the records with start <= time < stop."""
+        if not len(self.bucket_ids):
+            return
+        i = np.searchsorted(self.bucket_ids, int(start // self.bucket), side="right") - 1
+        first = self.bucket_first[max(i, 0)]
+        if first >= len(self.offsets):
+            return
+        with PcapReader(self.path) as reader:
+            for record in reader.records(int(self.offsets[first]), self.indexed_size):
+                if record.time >= stop:
+                    return
+                if record.time >= start:
+                    yield record
+
+    def flow(self, flow: FiveTuple):
+        """Yield the records of one flow, in capture order."""
+        if flow not in self._flow_lookup:
+            return
+        if self._flow_order is None:
+            self._flow_order = np.argsort(self.flow_ids, kind="stable")
+            self._flow_ptr = np.searchsorted(self.flow_ids[self._flow_order],
+                                             np.arange(len(self.flow_table) + 1))
+        k = self._flow_lookup[flow]
+        positions = self._flow_order[self._flow_ptr[k]:self._flow_ptr[k + 1]]
+        with PcapReader(self.path) as reader:
+            for offset in self.offsets[positions]:
+                yield reader.read_at(int(offset))
+
+    def _flow_id(self, flow) -> int:
+        if flow is None:
+            return NO_FLOW
+        if flow not in self._flow_lookup:
+            self._flow_lookup[flow] = len(self.flow_table)
+            self.flow_table.append(flow)
+        return self._flow_lookup[flow]
+
+
+def _aton(address: str) -> int:
+    return struct.unpack("!I", socket.inet_aton(address))[0]
+
+
+def _ntoa(address) -> str:
+    return socket.inet_ntoa(struct.pack("!I", int(address)))
@@ -0,0 +1,73 @@
+import ns.core
+import ns.traffic_control
+
+from .telemetry import schedule_periodic
+
+
+# Reasons RedQueueDisc gives for its marks and drops. Below max_th it marks and drops at random
+# ("unforced"), from max_th on every packet ("forced").
+FORCED_MARK, UNFORCED_MARK = "Forced mark", "Unforced mark"
+FORCED_DROP, UNFORCED_DROP = "Forced drop", "Unforced drop"
+
+
+class QueueMonitor:
+    """
+    > Marked, dropped and enqueued packets of the queue discs installed by
+      Model.add_marking_queue, plus their occupancy polled every interval simulated seconds.
+    > Queues are named by direction, "n6->n7" is the egress queue of node 6 on n6n7. See
+      SimulationResult.queues and metrics.queueing_delay_ms.
+    > A step queue (min_th = max_th = K) has no random marking range, so all its marks and
+      early drops should be forced, i.e. happen at a queue of K packets or more. stats() flags
+      step queues and counts the unforced ones; SimulationResult.print_flows warns about them.
+    """
+    def __init__(self, interval: float = 0.01):
+        if interval <= 0:
+            raise ValueError(f"The queue sampling interval {interval} should be larger than 0.")
+        self.interval = interval
+        self.queue_discs = {}
+        self.samples = {}
+        self.step = set()
+
+    def add(self, name: str, queue_disc, step: bool = False):
+        self.queue_discs[name] = queue_disc
+        if step:
+            self.step.add(name)
+        self.samples[name] = [0, 0, 0]     # samples, sum and max of the queued bytes
+
+    def attach(self, stop_time: float):
+        if self.queue_discs:
+            schedule_periodic(self.interval, self.sample, stop_time)
+
+    def sample(self):
+        for name, queue_disc in self.queue_discs.items():
+            queued = queue_disc.GetNBytes()
+            samples = self.samples[name]
+            samples[0] += 1
+            samples[1] += queued
+            samples[2] = max(samples[2], queued)
+
+    def stats(self) -> dict:
+        queues = {}
+        for name, queue_disc in self.queue_discs.items():
+            stats = queue_disc.GetStats()
+            n, total, peak = self.samples[name]
+            queues[name] = {"enqueued": stats.nTotalEnqueuedPackets,
+                            "marked": stats.nTotalMarkedPackets,
+                            "dropped": stats.nTotalDroppedPackets,
+                            "forced": stats.GetNMarkedPackets(FORCED_MARK) + stats.GetNDroppedPackets(FORCED_DROP),
+                            "step": name in self.step,
+                            "unforced": stats.GetNMarkedPackets(UNFORCED_MARK) + stats.GetNDroppedPackets(UNFORCED_DROP),
+                            "mean_queue_bytes": total / n if n else 0.0,
+                            "max_queue_bytes": peak}
+        return queues
+
+
+def queue_name(a: int, b: int) -> str:
+    return f"n{a}->n{b}"
+
+
+def root_queue_disc(device):
+    """The queue disc on device, or None if it has none."""
+    traffic_control = device.GetNode().GetObject(ns.traffic_control.TrafficControlLayer.GetTypeId())
+    queue_disc = traffic_control.GetRootQueueDiscOnDevice(device) if traffic_control else None
+    return queue_disc if queue_disc else None
@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import sys
+
+from .metrics import jain_fairness, loss_rate
+from .model import NetworkParams
+from .scenario import Scenario, run_many
+from .tcp_version import TCPVersion
+from .topology import match_flows
+
+
+# The experiments of sim.py, as (label, applications).
+EXPERIMENTS = [
+    ("exp1", [(4, 1, "n1n6", 1, 20, "TCP", 8080),
+              (3, 1, "n1n6", 1, 20, "TCP", 8081)]),
+    ("exp2", [(4, 1, "n1n6", 1, 20, "TCP", 8080),
+              (3, 1, "n1n6", 1, 20, "TCP", 8081),
+              (0, 1, "n1n6", 1, 20, "TCP", 8082)]),
+    ("exp3", [(4, 1, "n1n6", 1, 20, "TCP", 8080),
+              (3, 1, "n1n6", 1, 20, "TCP", 8081),
+              (0, 1, "n1n6", 1, 20, "TCP", 8082),
+              (2, 1, "n1n6", 1, 20, "TCP", 8083)]),
+    ("exp_retransmissions", [(4, 1, "n1n6", 1, 20, "TCP", 8080),
+                             (0, 1, "n1n6", 1, 20, "TCP", 8081),
+                             (3, 2, "n2n6", 10, 20, "UDP", 8082)]),
+]
+NETPARAMS = NetworkParams(latency_ms=10, error_rate=0.0)
+
+# Tolerance bands: relative for throughput, absolute for loss rate and fairness.
+THROUGHPUT_TOLERANCE    = 0.05
+LOSS_TOLERANCE          = 0.005
+FAIRNESS_TOLERANCE      = 0.02
+
+
+def pinned_scenarios(variants=tuple(TCPVersion)) -> list:
+    return [Scenario(NETPARAMS, variant, applications, label=f"{name}-{variant.name}")
+            for variant in variants for name, applications in EXPERIMENTS]
+
+
+def scenario_metrics(scenario: Scenario, result) -> dict:
+    flows, throughputs = {}, []
+    for (src, dst, _, _, _, kind, port), flow in zip(scenario.applications, match_flows(scenario, result)):
+        throughput = flow.throughput_mbps if flow is not None else 0.0
+        flows[f"{kind} n{src} -> n{dst}:{port}"] = {"throughput_mbps": throughput,
+                                                    "loss_rate": loss_rate([flow]) if flow is not None else 0.0}
+        if kind == "TCP":
+            throughputs.append(throughput)
+    return {"flows": flows, "fairness": jain_fairness(throughputs) if throughputs else 1.0}
+
+
+def compare(baseline: dict, current: dict) -> list:
+    """Rows (scenario, flow, metric, baseline, current, allowed) of every change outside its band."""
+    changes = []
+    for label, metrics in sorted(current.items()):
+        reference = baseline.get(label)
+        if reference is None:
+            changes.append((label, "", "missing from baseline", None, None, None))
+            continue
+        if abs(metrics["fairness"] - reference["fairness"]) > FAIRNESS_TOLERANCE:
+            changes.append((label, "", "fairness", reference["fairness"], metrics["fairness"], FAIRNESS_TOLERANCE))
+        for flow, values in sorted(metrics["flows"].items()):
+            before = reference["flows"].get(flow)
+            if before is None:
+                changes.append((label, flow, "missing from baseline", None, None, None))
+                continue
+            allowed = THROUGHPUT_TOLERANCE * before["throughput_mbps"]
+            if abs(values["throughput_mbps"] - before["throughput_mbps"]) > allowed:
+                changes.append((label, flow, "throughput_mbps", before["throughput_mbps"],
+                                values["throughput_mbps"], allowed))
+            if abs(values["loss_rate"] - before["loss_rate"]) > LOSS_TOLERANCE:
+                changes.append((label, flow, "loss_rate", before["loss_rate"], values["loss_rate"], LOSS_TOLERANCE))
+    for label in sorted(set(baseline) - set(current)):
+        changes.append((label, "", "missing from run", None, None, None))
+    return changes
+
+
+def format_changes(changes) -> str:
+    def number(value):
+        return "-" if value is None else f"{value:.4f}"
+    lines = [f"{'scenario':<32} {'flow':<22} {'metric':<22} {'baseline':>10} {'current':>10} {'allowed':>10}"]
+    for label, flow, metric, before, after, allowed in changes:
+        lines.append(f"{label:<32} {flow:<22} {metric:<22} {number(before):>10} {number(after):>10} {number(allowed):>10}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the pinned experiments against a stored baseline.")
+    parser.add_argument("--baseline", default="results/baseline.json", help="baseline file")
+    parser.add_argument("--update", action="store_true", help="write the current metrics as the new baseline")
+    parser.add_argument("--variants", help="comma separated TCPVersion names, default all")
+    parser.add_argument("--workers", type=int, default=None, help="number of parallel simulations")
+    args = parser.parse_args(argv)
+
+    variants = [TCPVersion[name] for name in args.variants.split(",")] if args.variants else list(TCPVersion)
+    scenarios = pinned_scenarios(variants)
+    results = run_many(scenarios, workers=args.workers)
+    current = {scenario.label: scenario_metrics(scenario, result) for scenario, result in zip(scenarios, results)}
+
+    if args.update:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print(f"Wrote the baseline of {len(current)} scenarios to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.variants:
+        baseline = {label: metrics for label, metrics in baseline.items()
+                    if label.rsplit("-", 1)[-1] in {variant.name for variant in variants}}
+    changes = compare(baseline, current)
+    if changes:
+        print(format_changes(changes))
+        print(f"{len(changes)} significant changes against {args.baseline}")
+        return 1
+    print(f"{len(current)} scenarios within tolerance of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
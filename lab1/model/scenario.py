@@ -0,0 +1,139 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+
+import ns.core
+
+from .model import Model, NetworkParams
+from .losses import loss_from_dict, loss_to_dict
+from .tcp_version import TCPVersion, TcpProfile
+
+
+@dataclass
+class Scenario:
+    """
+    > Everything needed to rebuild and rerun one Model, so runs can be cached and sent to
+      worker processes:
+        '''
+        scenario = Scenario(NetworkParams(latency_ms=10), TCPVersion.LinuxReno,
+                            applications=[(4, 1, "n1n6", 1, 20, "TCP", 8080)])
+        result = run_scenario(scenario)
+        '''
+    > applications holds the arguments of Model.add_application, errors the links given to
+      Model.add_error, or (link, loss) pairs for the loss models of losses. run selects the ns-3 RNG run, so replications differ.
+    > events holds the arguments of Model.schedule as (time, link, rate, up, error_rate),
+      throughput_interval enables Model.enable_throughput_sampling and counter_interval
+      Model.enable_link_counters. These and the fields below only enter the key when set, so
+      the keys of stored runs without them stay valid.
+    > finite_flows holds the arguments of Model.add_finite_flows, see workload.Workload.rows,
+      and marking_queues those of Model.add_marking_queue, e.g. [("n6n7", 20)].
+    > profile is the TcpProfile of the run, None for the default of tcp_version.
+    > max_wall_time and max_events are the run budgets of Model.start. They are not part of
+      the key; a truncated result in a store is rerun instead of reused.
+    """
+    netparams: NetworkParams
+    tcp_version: TCPVersion             = TCPVersion.LinuxReno
+    applications: list                  = field(default_factory=list)
+    errors: list                        = field(default_factory=list)
+    run: int                            = 1
+    events: list                        = field(default_factory=list)
+    throughput_interval: float          = None
+    counter_interval: float             = None
+    finite_flows: list                  = field(default_factory=list)
+    marking_queues: list                = field(default_factory=list)
+    profile: TcpProfile                 = None
+    label: str                          = ""
+    max_wall_time: float                = None
+    max_events: int                     = None
+
+    def key(self) -> dict:
+        key = {"netparams": asdict(self.netparams),
+               "tcp_version": self.tcp_version.name,
+               "applications": [list(application) for application in self.applications],
+               "errors": [error if isinstance(error, str) else [error[0], loss_to_dict(error[1])]
+                          for error in self.errors],
+               "run": self.run}
+        if self.events:
+            key["events"] = [list(event) for event in self.events]
+        if self.throughput_interval is not None:
+            key["throughput_interval"] = self.throughput_interval
+        if self.counter_interval is not None:
+            key["counter_interval"] = self.counter_interval
+        if self.finite_flows:
+            key["finite_flows"] = [list(flow) for flow in self.finite_flows]
+        if self.marking_queues:
+            key["marking_queues"] = [list(queue) for queue in self.marking_queues]
+        if self.profile is not None:
+            key["profile"] = asdict(self.profile)
+        return key
+
+    @classmethod
+    def from_key(cls, key: dict):
+        return cls(NetworkParams(**key["netparams"]),
+                   TCPVersion[key["tcp_version"]],
+                   applications=[tuple(application) for application in key["applications"]],
+                   errors=[error if isinstance(error, str) else (error[0], loss_from_dict(error[1]))
+                           for error in key["errors"]],
+                   run=key["run"],
+                   events=[tuple(event) for event in key.get("events", [])],
+                   throughput_interval=key.get("throughput_interval"),
+                   counter_interval=key.get("counter_interval"),
+                   finite_flows=[tuple(flow) for flow in key.get("finite_flows", [])],
+                   marking_queues=[tuple(queue) for queue in key.get("marking_queues", [])],
+                   profile=TcpProfile(**key["profile"]) if "profile" in key else None)
+
+    def error_rates(self) -> dict:
+        """link -> mean loss rate of every link with an error model."""
+        rates = {}
+        for error in self.errors:
+            if isinstance(error, str):
+                rates[error] = self.netparams.error_rate
+            else:
+                rates[error[0]] = error[1].mean_loss
+        return rates
+
+    def build(self) -> Model:
+        model = Model(self.netparams, tcp_version=self.tcp_version, profile=self.profile)
+        ns.core.RngSeedManager.SetRun(self.run)
+        if self.applications:
+            model.add_applications(*zip(*self.applications))
+        if self.finite_flows:
+            model.add_finite_flows(*zip(*self.finite_flows))
+        for error in self.errors:
+            model.add_error(*((error,) if isinstance(error, str) else error))
+        for queue in self.marking_queues:
+            model.add_marking_queue(*queue)
+        for event in self.events:
+            model.schedule(*event)
+        if self.throughput_interval is not None:
+            model.enable_throughput_sampling(self.throughput_interval)
+        if self.counter_interval is not None:
+            model.enable_link_counters(self.counter_interval)
+        return model
+
+
+def run_scenario(scenario: Scenario):
+    return scenario.build().start(scenario.max_wall_time, scenario.max_events)
+
+
+def run_many(scenarios, store=None, workers: int = None, progress=sys.stderr):
+    """
+    Run scenarios in a process pool, one fresh process per simulation since ns-3 keeps global
+    state. Results already in store are reused and new ones are added to it.
+    Returns the results in the order of scenarios.
+    """
+    results = [store.get(scenario.key()) if store is not None else None for scenario in scenarios]
+    missing = [i for i, result in enumerate(results) if result is None or result.truncated]
+    if not missing:
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+        futures = {pool.submit(run_scenario, scenarios[i]): i for i in missing}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            results[i] = future.result()
+            if store is not None:
+                store.put(scenarios[i].key(), results[i])
+            if progress is not None:
+                print(f"[{done}/{len(missing)}] {scenarios[i].label or scenarios[i].key()}", file=progress)
+    return results
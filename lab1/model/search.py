@@ -0,0 +1,135 @@
+import os
+import statistics
+import sys
+from dataclasses import dataclass, field
+
+from .scenario import run_many
+
+
+@dataclass
+class Probe:
+    x: float
+    values: list = field(default_factory=list)
+
+    @property
+    def mean(self) -> float:
+        return statistics.fmean(self.values)
+
+
+@dataclass
+class SearchResult:
+    threshold: float
+    low: float
+    high: float
+    probes: list
+    simulations: int
+
+
+class ThresholdSearch:
+    """
+    > Finds the largest x for which metric(result) stays on the right side of target, for
+      example the highest on_off_rate before the loss of the flows across n6n7 exceeds 1%:
+        '''
+        def build(rate, run):
+            return Scenario(NetworkParams(latency_ms=10, on_off_rate=rate), TCPVersion.LinuxReno,
+                            applications=[(4, 1, "n1n6", 1, 20, "TCP", 8080),
+                                          (3, 1, "n1n6", 1, 20, "TCP", 8081)], run=run)
+
+        search = ThresholdSearch(build, lambda result: loss_rate(data_flows(result)), 0.01,
+                                 store=ResultStore("results/runs.jsonl"))
+        search.bisect(50000, 2000000, tolerance=10000).threshold
+        '''
+    > build(x, run) returns the Scenario to simulate at x for replication run, metric maps its
+      SimulationResult to a number. With increasing=True the metric grows with x and x is
+      acceptable while metric <= target, otherwise while metric >= target (e.g. Jain fairness
+      of the data flows as the number of flows grows).
+    > bisect assumes the replication mean is monotone in x and evaluates several points per
+      round in parallel. stochastic is a Robbins-Monro iteration with Polyak averaging for
+      metrics too noisy to bisect.
+    > Every run goes through store, so repeated searches and overlapping probes are free.
+    """
+    def __init__(self, build, metric, target: float, store=None, workers: int = None,
+                 replications: int = 1, increasing: bool = True, progress=sys.stderr):
+        if replications < 1:
+            raise ValueError(f"The number of replications {replications} should be at least 1.")
+        self.build = build
+        self.metric = metric
+        self.target = target
+        self.store = store
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.replications = replications
+        self.increasing = increasing
+        self.progress = progress
+        self.simulations = 0
+        self._values = {}
+
+    def acceptable(self, value: float) -> bool:
+        return value <= self.target if self.increasing else value >= self.target
+
+    def evaluate(self, xs, runs=None) -> list:
+        """Metric values at every x, one per run (default: 1..replications)."""
+        runs = list(runs) if runs is not None else list(range(1, self.replications + 1))
+        pending = []
+        for x in xs:
+            for run in runs:
+                if (x, run) in self._values:
+                    continue
+                scenario = self.build(x, run)
+                cached = self.store.get(scenario.key()) if self.store is not None else None
+                if cached is not None and not cached.truncated:
+                    self._values[(x, run)] = self.metric(cached)
+                else:
+                    pending.append(((x, run), scenario))
+        if pending:
+            results = run_many([scenario for _, scenario in pending], self.store, self.workers, self.progress)
+            for (point, _), result in zip(pending, results):
+                self._values[point] = self.metric(result)
+            self.simulations += len(pending)
+        return [Probe(x, [self._values[(x, run)] for run in runs]) for x in xs]
+
+    def bisect(self, low: float, high: float, tolerance: float, integer: bool = False,
+               max_rounds: int = 50) -> SearchResult:
+        """Shrink [low, high] around the threshold until it is narrower than tolerance."""
+        points = max(1, self.workers // self.replications)
+        probes = self.evaluate([low, high])
+        if not self.acceptable(probes[0].mean):
+            raise ValueError(f"The metric is already {probes[0].mean} at the lower bound {low}.")
+        if self.acceptable(probes[1].mean):
+            return SearchResult(high, high, high, probes, self.simulations)
+
+        for _ in range(max_rounds):
+            if high - low <= max(tolerance, 1 if integer else 0):
+                break
+            step = (high - low) / (points + 1)
+            xs = [low + step * (i + 1) for i in range(points)]
+            if integer:
+                xs = sorted({int(round(x)) for x in xs} - {low, high}) or [low + (high - low) // 2]
+            round_probes = self.evaluate(xs)
+            probes.extend(round_probes)
+            for probe in round_probes:
+                if self.acceptable(probe.mean):
+                    low = probe.x
+                else:
+                    high = probe.x
+                    break
+        return SearchResult(low, low, high, probes, self.simulations)
+
+    def stochastic(self, x0: float, low: float, high: float, iterations: int = 20,
+                   gain: float = None, batch: int = None) -> SearchResult:
+        """
+        Robbins-Monro: x <- x - gain_n * (mean - target) / |target|, with gain_n = gain / n**0.602.
+        Each iteration averages batch fresh replications, run in parallel.
+        """
+        batch = batch if batch is not None else max(self.replications, self.workers)
+        gain = gain if gain is not None else (high - low) / 4
+        scale = abs(self.target) or 1.0
+        sign = 1 if self.increasing else -1
+        x, iterates, probes = x0, [], []
+        for n in range(1, iterations + 1):
+            probe = self.evaluate([x], runs=range((n - 1) * batch + 1, n * batch + 1))[0]
+            probes.append(probe)
+            x = min(max(x - sign * gain / n ** 0.602 * (probe.mean - self.target) / scale, low), high)
+            iterates.append(x)
+        tail = iterates[len(iterates) // 2:]
+        estimate = statistics.fmean(tail)
+        return SearchResult(estimate, min(tail), max(tail), probes, self.simulations)
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict
+
+from .model import FlowStats, SimulationResult
+
+
+def scenario_hash(key: dict) -> str:
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def result_to_dict(result: SimulationResult) -> dict:
+    return asdict(result)
+
+
+def result_from_dict(record: dict) -> SimulationResult:
+    fields = dict(record)
+    fields["flows"] = [FlowStats(**flow) for flow in record.get("flows", [])]
+    if record.get("remote_flows") is not None:
+        fields["remote_flows"] = [FlowStats(**flow) for flow in record["remote_flows"]]
+    known = SimulationResult.__dataclass_fields__
+    return SimulationResult(**{name: value for name, value in fields.items() if name in known})
+
+
+class ResultStore:
+    """
+    > Append-only JSON lines file of simulation results, keyed by the scenario that produced
+      them (see Scenario.key). Used to skip simulations that were already run and as training
+      data for offline analysis.
+    > Several processes may append to the same file; the last record of a key wins.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._records = {}
+        self._position = 0
+
+    def _refresh(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            f.seek(self._position)
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                self._records[record["hash"]] = record
+                self._position += len(line.encode())
+
+    def get(self, key: dict):
+        self._refresh()
+        record = self._records.get(scenario_hash(key))
+        return result_from_dict(record["result"]) if record is not None else None
+
+    def put(self, key: dict, result: SimulationResult):
+        record = {"hash": scenario_hash(key), "scenario": key, "result": result_to_dict(result)}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, default=_json_default) + "\n")
+
+    def records(self):
+        """Yield (scenario key, SimulationResult) of every stored run."""
+        self._refresh()
+        for record in self._records.values():
+            yield record["scenario"], result_from_dict(record["result"])
+
+    def __len__(self):
+        self._refresh()
+        return len(self._records)
+
+
+def _json_default(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serialisable.")
@@ -0,0 +1,189 @@
+import random
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+from .fluid import application_rate
+from .metrics import loss_rate
+from .model import LINKS, SimulationResult
+from .scenario import Scenario, run_many
+from .tcp_version import TCPVersion
+from .topology import N_DIRECTED, directed_link, match_flows, shortest_path
+
+
+FEATURES = ["latency_ms", "rate", "on_off_rate", "error_rate", "tcp_version", "tcp", "hops",
+            "applications", "sharing", "path_load", "duration", "error_links"]
+TCP_VERSIONS = list(TCPVersion)
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def application_features(scenario: Scenario) -> np.ndarray:
+    """One row of FEATURES per application of scenario."""
+    params = scenario.netparams
+    paths = []
+    load = np.zeros(N_DIRECTED)
+    for src, dst, _, _, _, kind, _ in scenario.applications:
+        path = shortest_path(src, dst)
+        links = [directed_link(*hop) for hop in zip(path, path[1:])]
+        paths.append(links)
+        load[links] += application_rate(kind, params)
+    users = np.zeros(N_DIRECTED)
+    for links in paths:
+        users[links] += 1
+    errors = {directed_link(*LINKS[link]) for link in scenario.error_rates()}
+
+    rows = []
+    for (src, dst, _, start, stop, kind, _), links in zip(scenario.applications, paths):
+        rows.append([params.latency_ms,
+                     params.rate,
+                     params.on_off_rate,
+                     params.error_rate,
+                     TCP_VERSIONS.index(scenario.tcp_version),
+                     kind == "TCP",
+                     len(links),
+                     len(scenario.applications),
+                     users[links].max(),
+                     load[links].max() / params.rate,
+                     stop - start,
+                     sum(link in errors for link in links)])
+    return np.array(rows, dtype=float).reshape(-1, len(FEATURES))
+
+
+def training_set(pairs):
+    """Features and (throughput Mbps, loss rate) targets of every matched application flow."""
+    X, Y = [], []
+    for scenario, result in pairs:
+        if result.truncated:
+            continue
+        features = application_features(scenario)
+        for row, flow in zip(features, match_flows(scenario, result)):
+            if flow is not None:
+                X.append(row)
+                Y.append([flow.throughput_mbps, loss_rate([flow])])
+    return np.array(X).reshape(-1, len(FEATURES)), np.array(Y).reshape(-1, 2)
+
+
+def holdout_split(pairs, fraction: float = 0.2, seed: int = 42):
+    pairs = list(pairs)
+    random.Random(seed).shuffle(pairs)
+    n = int(len(pairs) * fraction)
+    return pairs[n:], pairs[:n]
+
+
+@dataclass
+class FlowPrediction:
+    application: tuple
+    throughput_mbps: float
+    throughput_interval: tuple
+    loss_rate: float
+    loss_interval: tuple
+
+    @property
+    def throughput_uncertainty(self) -> float:
+        """Half width of the 10%-90% interval relative to the median."""
+        low, high = self.throughput_interval
+        return (high - low) / 2 / max(abs(self.throughput_mbps), 1e-9)
+
+
+@dataclass
+class SurrogateResult:
+    scenario: Scenario
+    predictions: list
+    simulated: SimulationResult = None
+
+    @property
+    def confident(self) -> bool:
+        return self.simulated is None
+
+
+class Surrogate:
+    """
+    > Predicts per-flow throughput and loss of a Scenario from stored Model runs, with
+      gradient boosted quantile regression (scikit-learn, CPU only):
+        '''
+        train, held_out = holdout_split((Scenario.from_key(key), result) for key, result in store.records())
+        surrogate = Surrogate().fit(train)
+        print(surrogate.evaluate(held_out))
+        result = surrogate.query(scenario, store=store)
+        '''
+    > The 10% and 90% quantiles give the uncertainty of every prediction. query only falls
+      through to a real simulation when the throughput uncertainty of some flow is above
+      max_uncertainty, and records how far off the prediction was in history.
+    """
+    def __init__(self, max_uncertainty: float = 0.15, **gradient_boosting):
+        self.max_uncertainty = max_uncertainty
+        self.parameters = {"n_estimators": 200, "max_depth": 3, "learning_rate": 0.05, **gradient_boosting}
+        self.models = {}
+        self.history = []
+
+    def fit(self, pairs):
+        try:
+            from sklearn.ensemble import GradientBoostingRegressor
+        except ImportError as error:
+            raise ImportError("The surrogate needs scikit-learn: pip install scikit-learn") from error
+        X, Y = training_set(pairs)
+        if not len(X):
+            raise ValueError("There are no matched flows to train the surrogate on.")
+        self.models = {}
+        for target in range(Y.shape[1]):
+            for quantile in QUANTILES:
+                model = GradientBoostingRegressor(loss="quantile", alpha=quantile, **self.parameters)
+                self.models[(target, quantile)] = model.fit(X, Y[:, target])
+        return self
+
+    def predict(self, scenario: Scenario) -> list:
+        if not self.models:
+            raise ValueError("The surrogate should be fit before predicting.")
+        X = application_features(scenario)
+        if not len(X):
+            return []
+        q = {key: model.predict(X) for key, model in self.models.items()}
+        return [FlowPrediction(application,
+                               float(q[(0, 0.5)][i]),
+                               (float(q[(0, 0.1)][i]), float(q[(0, 0.9)][i])),
+                               float(q[(1, 0.5)][i]),
+                               (float(q[(1, 0.1)][i]), float(q[(1, 0.9)][i])))
+                for i, application in enumerate(scenario.applications)]
+
+    def query(self, scenario: Scenario, store=None, workers: int = None, progress=sys.stderr) -> SurrogateResult:
+        predictions = self.predict(scenario)
+        if all(p.throughput_uncertainty <= self.max_uncertainty for p in predictions):
+            return SurrogateResult(scenario, predictions)
+        result = run_many([scenario], store, workers, progress)[0]
+        for prediction, flow in zip(predictions, match_flows(scenario, result)):
+            if flow is not None:
+                self.history.append((prediction, flow.throughput_mbps, loss_rate([flow])))
+        return SurrogateResult(scenario, predictions, result)
+
+    def evaluate(self, pairs) -> dict:
+        """Accuracy against real runs: errors of the median and coverage of the 10-90% interval."""
+        errors, covered, confident = [], [], []
+        for scenario, result in pairs:
+            for prediction, flow in zip(self.predict(scenario), match_flows(scenario, result)):
+                if flow is None:
+                    continue
+                low, high = prediction.throughput_interval
+                errors.append(abs(prediction.throughput_mbps - flow.throughput_mbps)
+                              / max(flow.throughput_mbps, 1e-9))
+                covered.append(low <= flow.throughput_mbps <= high)
+                confident.append(prediction.throughput_uncertainty <= self.max_uncertainty)
+        if not errors:
+            return {"flows": 0}
+        errors, confident = np.array(errors), np.array(confident)
+        return {"flows": len(errors),
+                "median_error": float(np.median(errors)),
+                "p90_error": float(np.percentile(errors, 90)),
+                "coverage": float(np.mean(covered)),
+                "confident": float(confident.mean()),
+                "confident_p90_error": float(np.percentile(errors[confident], 90)) if confident.any() else None}
+
+    def tracked_accuracy(self) -> dict:
+        """Errors of the predictions that fell through to a real run, see query."""
+        if not self.history:
+            return {"flows": 0}
+        errors = np.array([abs(p.throughput_mbps - measured) / max(measured, 1e-9)
+                           for p, measured, _ in self.history])
+        return {"flows": len(errors),
+                "median_error": float(np.median(errors)),
+                "p90_error": float(np.percentile(errors, 90))}
@@ -0,0 +1,260 @@
+import os
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+
+from .pcap import (DLT_EN10MB, DLT_PPP, DLT_RAW, GLOBAL_HEADER_LEN, RECORD_HEADER_LEN, FiveTuple,
+                   PcapReader)
+from .pcap_index import PcapIndex
+
+
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+
+_IP_OFFSET = {DLT_PPP: 2, DLT_EN10MB: 14, DLT_RAW: 0}
+
+
+@dataclass
+class Segments:
+    """Column arrays of every IPv4 TCP segment of a capture, in capture order."""
+    time: np.ndarray
+    src: np.ndarray
+    sport: np.ndarray
+    dst: np.ndarray
+    dport: np.ndarray
+    seq: np.ndarray
+    ack: np.ndarray
+    flags: np.ndarray
+    payload: np.ndarray
+
+
+@dataclass
+class IpPackets:
+    """Column arrays of every IPv4 packet of a capture, in capture order."""
+    offset: np.ndarray      # byte offset of the record
+    time: np.ndarray
+    size: np.ndarray        # original length of the frame
+    src: np.ndarray
+    dst: np.ndarray
+    proto: np.ndarray
+    ident: np.ndarray       # IP identification
+
+
+@dataclass
+class FlowAnalysis:
+    """
+    > Sequence space of one TCP data direction, relative to its first sequence number.
+    > Send times, RTT samples and bytes in flight are as seen at the capture point, so they
+      are exact for a capture on the sender's access link and partial anywhere else.
+    """
+    flow: FiveTuple
+    time: np.ndarray                # send time of every data segment
+    seq: np.ndarray
+    seq_end: np.ndarray
+    retransmission: np.ndarray      # bool per data segment
+    spurious: np.ndarray            # bool per data segment, subset of retransmission
+    dupack_time: np.ndarray         # times of the duplicate ACKs on the reverse direction
+    rtt_time: np.ndarray
+    rtt: np.ndarray
+    inflight: np.ndarray            # bytes in flight after every data segment, see time
+
+    @property
+    def retransmissions(self) -> int:
+        return int(self.retransmission.sum())
+
+    @property
+    def spurious_retransmissions(self) -> int:
+        return int(self.spurious.sum())
+
+    @property
+    def dupacks(self) -> int:
+        return len(self.dupack_time)
+
+
+def record_offsets(path: str):
+    """Byte offset of every record. Reuses the sidecar index when there is one."""
+    if os.path.exists(PcapIndex.sidecar_path(path)):
+        return PcapIndex.open(path).offsets.astype(np.int64)
+    with PcapReader(path) as reader:
+        endian = reader.endian
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    caplen = struct.Struct(endian + "I")
+    offsets = []
+    offset = GLOBAL_HEADER_LEN
+    size = len(data)
+    while offset + RECORD_HEADER_LEN <= size:
+        length = caplen.unpack_from(data, offset + 8)[0]
+        if offset + RECORD_HEADER_LEN + length > size:
+            break
+        offsets.append(offset)
+        offset += RECORD_HEADER_LEN + length
+    return np.array(offsets, dtype=np.int64)
+
+
+def read_segments(path: str) -> Segments:
+    """Decode the TCP headers of a whole capture into column arrays, without a per-packet loop."""
+    with PcapReader(path) as reader:
+        endian, resolution, linktype = reader.endian, reader.resolution, reader.linktype
+    if linktype not in _IP_OFFSET:
+        raise ValueError(f"Unsupported pcap link type {linktype}.")
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    offsets = record_offsets(path)
+
+    caplen = _uint(data, offsets + 8, 4, endian)
+    frame = offsets + RECORD_HEADER_LEN
+    ip = frame + _IP_OFFSET[linktype]
+    keep = caplen >= _IP_OFFSET[linktype] + 40
+    if linktype == DLT_PPP:
+        keep &= _uint(data, frame, 2) == 0x0021
+    elif linktype == DLT_EN10MB:
+        keep &= _uint(data, frame + 12, 2) == 0x0800
+    ip = np.where(keep, ip, frame)
+    keep &= (data[ip] >> 4 == 4) & (data[ip + 9] == 6)
+
+    offsets, ip = offsets[keep], ip[keep]
+    ip_len = (data[ip] & 0x0f).astype(np.int64) * 4
+    tcp = ip + ip_len
+    tcp_len = (data[tcp + 12] >> 4).astype(np.int64) * 4
+    return Segments(
+        time=_uint(data, offsets, 4, endian) + _uint(data, offsets + 4, 4, endian) * resolution,
+        src=_uint(data, ip + 12, 4),
+        sport=_uint(data, tcp, 2),
+        dst=_uint(data, ip + 16, 4),
+        dport=_uint(data, tcp + 2, 2),
+        seq=_uint(data, tcp + 4, 4),
+        ack=_uint(data, tcp + 8, 4),
+        flags=data[tcp + 13].astype(np.uint8),
+        payload=_uint(data, ip + 2, 2) - ip_len - tcp_len)
+
+
+def read_ip_packets(path: str) -> IpPackets:
+    """Decode the IPv4 headers of a whole capture into column arrays, like read_segments."""
+    with PcapReader(path) as reader:
+        endian, resolution, linktype = reader.endian, reader.resolution, reader.linktype
+    if linktype not in _IP_OFFSET:
+        raise ValueError(f"Unsupported pcap link type {linktype}.")
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    offsets = record_offsets(path)
+
+    caplen = _uint(data, offsets + 8, 4, endian)
+    frame = offsets + RECORD_HEADER_LEN
+    ip = frame + _IP_OFFSET[linktype]
+    keep = caplen >= _IP_OFFSET[linktype] + 20
+    if linktype == DLT_PPP:
+        keep &= _uint(data, frame, 2) == 0x0021
+    elif linktype == DLT_EN10MB:
+        keep &= _uint(data, frame + 12, 2) == 0x0800
+    ip = np.where(keep, ip, frame)
+    keep &= data[ip] >> 4 == 4
+
+    offsets, ip = offsets[keep], ip[keep]
+    return IpPackets(
+        offset=offsets,
+        time=_uint(data, offsets, 4, endian) + _uint(data, offsets + 4, 4, endian) * resolution,
+        size=_uint(data, offsets + 12, 4, endian),
+        src=_uint(data, ip + 12, 4),
+        dst=_uint(data, ip + 16, 4),
+        proto=data[ip + 9].astype(np.int64),
+        ident=_uint(data, ip + 4, 2))
+
+
+def analyse_capture(path: str):
+    """Analyse every TCP data direction of a capture. Returns {FiveTuple: FlowAnalysis}."""
+    segments = read_segments(path)
+    keys = np.stack([segments.src, segments.sport, segments.dst, segments.dport], axis=1)
+    flows, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    lookup = {tuple(flow): i for i, flow in enumerate(flows.tolist())}
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(flows) + 1))
+
+    results = {}
+    for i, (src, sport, dst, dport) in enumerate(flows.tolist()):
+        forward = order[bounds[i]:bounds[i + 1]]
+        if not (segments.payload[forward] > 0).any():
+            continue
+        j = lookup.get((dst, dport, src, sport))
+        reverse = order[bounds[j]:bounds[j + 1]] if j is not None else order[:0]
+        flow = FiveTuple(6, _ntoa(src), sport, _ntoa(dst), dport)
+        results[flow] = analyse_flow(flow, segments, forward, reverse)
+    return results
+
+
+def analyse_flow(flow: FiveTuple, segments: Segments, forward: np.ndarray, reverse: np.ndarray):
+    """Retransmissions, duplicate ACKs, RTT samples and bytes in flight of one data direction."""
+    base = segments.seq[forward[0]]
+    syn = segments.flags[forward] & SYN != 0
+    data = forward[segments.payload[forward] > 0]
+    time = segments.time[data]
+    seq = _relative(segments.seq[data], base)
+    seq_end = seq + segments.payload[data]
+
+    # Highest sequence number sent before each segment: anything starting below it was sent before.
+    highest = np.maximum.accumulate(seq_end)
+    previous = np.concatenate([[int(syn.any())], highest[:-1]])
+    retransmission = seq < previous
+
+    # Cumulative ACKs from the receiver, made monotone so the first ACK to cover a byte can be
+    # found by binary search.
+    ack_time = segments.time[reverse]
+    acked = _relative(segments.ack[reverse], base)
+    ack_flags = segments.flags[reverse]
+    pure = (segments.payload[reverse] == 0) & (ack_flags & (SYN | FIN | RST) == 0)
+    dupack = pure & np.concatenate([[False], (acked[1:] == acked[:-1]) & pure[:-1]])
+    cumulative = np.maximum.accumulate(acked) if len(acked) else acked
+
+    covering = np.searchsorted(cumulative, seq_end, side="left")
+    answered = covering < len(cumulative)
+    acked_at = np.full(len(seq_end), np.inf)
+    acked_at[answered] = ack_time[covering[answered]]
+
+    # Karn: only segments that were never retransmitted give unambiguous RTT samples.
+    sent_again = np.zeros(len(seq_end), dtype=bool)
+    if retransmission.any():
+        later = np.flatnonzero(retransmission)
+        first_copy = np.searchsorted(highest, seq_end[later], side="left")
+        sent_again[first_copy] = True
+    sample = answered & ~retransmission & ~sent_again
+    rtt = acked_at[sample] - time[sample]
+    min_rtt = rtt.min() if len(rtt) else 0.0
+
+    # A retransmission is spurious if its data was already acknowledged, or if the ACK covering
+    # it came back faster than any real round trip, so it must have been triggered by the original.
+    spurious = retransmission & ((acked_at < time) | ((min_rtt > 0) & (acked_at - time < min_rtt)))
+
+    acked_before = np.searchsorted(ack_time, time, side="right") - 1
+    snd_una = np.zeros(len(time), dtype=np.int64)
+    seen = acked_before >= 0
+    snd_una[seen] = cumulative[acked_before[seen]]
+    inflight = highest - np.maximum(snd_una, 0)
+
+    return FlowAnalysis(flow=flow,
+                        time=time,
+                        seq=seq,
+                        seq_end=seq_end,
+                        retransmission=retransmission,
+                        spurious=spurious,
+                        dupack_time=ack_time[dupack],
+                        rtt_time=time[sample],
+                        rtt=rtt,
+                        inflight=inflight)
+
+
+def _uint(data, positions, size: int, endian: str = ">"):
+    """Gather unsigned integers of size bytes at every position of data."""
+    value = np.zeros(len(positions), dtype=np.int64)
+    order = range(size) if endian == ">" else reversed(range(size))
+    for i in order:
+        value = (value << 8) | data[positions + i]
+    return value
+
+
+def _relative(seq: np.ndarray, base) -> np.ndarray:
+    """Sequence numbers relative to base, allowing for one wrap around 2**32 in either direction."""
+    return (seq - base + (1 << 31)) % (1 << 32) - (1 << 31)
+
+
+def _ntoa(address: int) -> str:
+    return ".".join(str(address >> shift & 0xff) for shift in (24, 16, 8, 0))
@@ -1,3 +1,4 @@
+from dataclasses import dataclass, replace
 from enum import Enum
 import ns.core
 
@@ -21,4 +22,86 @@ class TCPVersion(Enum):
     
 
 def map_tcp_verbose(tcp_version: TCPVersion):
-    return ns.core.iLOG_LEVEL_LOGIC
\ No newline at end of file
+    return ns.core.iLOG_LEVEL_LOGIC
+
+
+@dataclass
+class TcpProfile:
+    """
+    > Socket tuning applied to every TCP socket of a Model through Config.SetDefault, by
+      Model.start right before the run. Every field is set on every run, so nothing carries
+      over from an earlier model. The defaults are ns-3's, except where a TCPVersion needs
+      something else, see for_version:
+        '''
+        profile = replace(TcpProfile.for_version(TCPVersion.Bbr), initial_cwnd=4)
+        mymodel = Model(NETPARAMS, tcp_version=TCPVersion.Bbr, profile=profile)
+        '''
+    > All fields are plain values so profiles can be swept like NetworkParams, e.g. with
+      dataclasses.replace in the build function of a ThresholdSearch.
+    """
+    segment_size: int             = 1448      # bytes, fills the 1500 byte MTU with timestamps
+    initial_cwnd: int             = 10        # segments
+    sack: bool                    = True
+    timestamps: bool              = True
+    min_rto_ms: float             = 1000.
+    send_buffer: int              = 131072    # bytes
+    receive_buffer: int           = 131072    # bytes
+    delayed_ack_count: int        = 2
+    delayed_ack_timeout_ms: float = 200.
+    pacing: bool                  = False
+    ecn: bool                     = False
+    westwood_plus: bool           = False     # TCPVersion.WestWood only
+
+    @classmethod
+    def for_version(cls, tcp_version: TCPVersion):
+        return replace(cls(), **VERSION_DEFAULTS.get(tcp_version, {}))
+
+    @property
+    def header_bytes(self) -> int:
+        """IP and TCP headers of a data segment, with the timestamp option padded to 12 bytes."""
+        return 40 + (12 if self.timestamps else 0)
+
+    def validate(self, tcp_version: TCPVersion):
+        headers = self.header_bytes
+        if not 0 < self.segment_size <= 1500 - headers:
+            raise ValueError(f"The segment size {self.segment_size} should be within (0, {1500 - headers}] "
+                             f"to fit the 1500 byte MTU.")
+        if self.initial_cwnd < 1:
+            raise ValueError(f"The initial congestion window {self.initial_cwnd} should be at least 1 segment.")
+        if self.min_rto_ms <= 0:
+            raise ValueError(f"The minimum RTO {self.min_rto_ms} should be larger than 0.")
+        if min(self.send_buffer, self.receive_buffer) < self.segment_size:
+            raise ValueError(f"The send and receive buffers ({self.send_buffer}, {self.receive_buffer}) "
+                             f"should hold at least one segment of {self.segment_size} bytes.")
+        if self.delayed_ack_count < 1:
+            raise ValueError(f"The delayed ACK count {self.delayed_ack_count} should be at least 1.")
+        if self.delayed_ack_timeout_ms < 0:
+            raise ValueError(f"The delayed ACK timeout {self.delayed_ack_timeout_ms} should not be negative.")
+        if self.westwood_plus and tcp_version != TCPVersion.WestWood:
+            raise ValueError(f"westwood_plus only applies to TCPVersion.WestWood, not {tcp_version.name}.")
+
+    def apply(self, tcp_version: TCPVersion):
+        self.validate(tcp_version)
+        set_default = ns.core.Config.SetDefault
+        set_default("ns3::TcpSocket::SegmentSize", ns.core.UintegerValue(self.segment_size))
+        set_default("ns3::TcpSocket::InitialCwnd", ns.core.UintegerValue(self.initial_cwnd))
+        set_default("ns3::TcpSocket::SndBufSize", ns.core.UintegerValue(self.send_buffer))
+        set_default("ns3::TcpSocket::RcvBufSize", ns.core.UintegerValue(self.receive_buffer))
+        set_default("ns3::TcpSocket::DelAckCount", ns.core.UintegerValue(self.delayed_ack_count))
+        set_default("ns3::TcpSocket::DelAckTimeout",
+                    ns.core.TimeValue(ns.core.MilliSeconds(int(self.delayed_ack_timeout_ms))))
+        set_default("ns3::TcpSocketBase::Sack", ns.core.BooleanValue(self.sack))
+        set_default("ns3::TcpSocketBase::Timestamp", ns.core.BooleanValue(self.timestamps))
+        set_default("ns3::TcpSocketBase::MinRto", ns.core.TimeValue(ns.core.MilliSeconds(int(self.min_rto_ms))))
+        set_default("ns3::TcpSocketState::EnablePacing", ns.core.BooleanValue(self.pacing))
+        set_default("ns3::TcpSocketBase::UseEcn", ns.core.StringValue("On" if self.ecn else "Off"))
+        if tcp_version == TCPVersion.WestWood:
+            set_default("ns3::TcpWestwood::ProtocolType",
+                        ns.core.StringValue("WestwoodPlus" if self.westwood_plus else "Westwood"))
+
+
+# The fields of TcpProfile a TCPVersion needs to behave as intended.
+VERSION_DEFAULTS = {
+    TCPVersion.Bbr:     {"pacing": True},
+    TCPVersion.Dctcp:   {"ecn": True},
+}
@@ -0,0 +1,179 @@
+import argparse
+import glob
+import json
+import os
+import resource
+import socket
+import sys
+import time
+
+import ns.core
+
+
+def schedule_periodic(interval: float, callback, stop_time: float = None):
+    """Call callback() every interval simulated seconds, from the first interval until stop_time."""
+    def tick():
+        callback()
+        if stop_time is None or ns.core.Simulator.Now().GetSeconds() + interval <= stop_time:
+            ns.core.Simulator.Schedule(ns.core.Seconds(interval), tick)
+    ns.core.Simulator.Schedule(ns.core.Seconds(interval), tick)
+
+
+def rss_mb() -> float:
+    """Current resident set size, or the peak where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class Telemetry:
+    """
+    > Periodic progress record of a running simulation, one JSON object per line:
+        '''
+        {"label": "exp1-LinuxReno", "sim_time": 12.0, "stop_time": 60.0, "wall_time": 3.1,
+         "ratio": 3.87, "events": 412331, "rss_mb": 91.2, "rx_bytes": {"10.1.4.1/49153->10.1.1.1/8080": 515320}}
+        '''
+    > Lines are appended to path and/or sent as UDP datagrams to address, a (host, port) pair.
+      Several workers can share one file or one aggregator, see aggregate and main.
+    > Enable it with Model.enable_telemetry. The event itself is cheap, but every sample walks
+      the FlowMonitor stats, so keep the interval in the order of simulated seconds.
+    """
+    def __init__(self, path: str = None, address: tuple = None, interval: float = 1.0, label: str = None):
+        if path is None and address is None:
+            raise ValueError("Telemetry needs a path or an address to report to.")
+        if interval <= 0:
+            raise ValueError(f"The telemetry interval {interval} should be larger than 0.")
+        self.path = path
+        self.address = address
+        self.interval = interval
+        self.label = label if label is not None else f"pid-{os.getpid()}"
+        self.file = None
+        self.socket = None
+        self.monitor = None
+        self.classifier = None
+        self.stop_time = None
+        self.wall_start = None
+
+    def attach(self, monitor, classifier, stop_time: float):
+        """Start reporting. Called by Model.start before Simulator.Run."""
+        self.monitor = monitor
+        self.classifier = classifier
+        self.stop_time = stop_time
+        self.wall_start = time.monotonic()
+        if self.path is not None:
+            self.file = open(self.path, "a", buffering=1)
+        if self.address is not None:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        schedule_periodic(self.interval, self.report, stop_time)
+
+    def sample(self) -> dict:
+        sim_time = ns.core.Simulator.Now().GetSeconds()
+        wall_time = time.monotonic() - self.wall_start
+        rx_bytes = {}
+        for flow_id, flow_stats in self.monitor.GetFlowStats():
+            t = self.classifier.FindFlow(flow_id)
+            rx_bytes[f"{t.sourceAddress}/{t.sourcePort}->{t.destinationAddress}/{t.destinationPort}"] = flow_stats.rxBytes
+        return {"label": self.label,
+                "sim_time": sim_time,
+                "stop_time": self.stop_time,
+                "wall_time": wall_time,
+                "ratio": sim_time / wall_time if wall_time > 0 else 0.0,
+                "events": ns.core.Simulator.GetEventCount(),
+                "rss_mb": rss_mb(),
+                "rx_bytes": rx_bytes}
+
+    def report(self, **extra):
+        line = json.dumps({**self.sample(), **extra})
+        if self.file is not None:
+            self.file.write(line + "\n")
+        if self.socket is not None:
+            self.socket.sendto(line.encode(), self.address)
+
+    def close(self):
+        """Send a final record marked done. Called by Model.start after Simulator.Run."""
+        if self.wall_start is None:
+            return
+        self.report(done=True)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+def aggregate(lines, state: dict = None) -> dict:
+    """Fold telemetry lines into the latest record per label."""
+    state = {} if state is None else state
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        state[record.get("label", "")] = record
+    return state
+
+
+def render(state: dict) -> str:
+    """A progress table of every worker plus a total line."""
+    rows = [f"{'label':<32} {'sim':>8} {'progress':>8} {'sim/wall':>9} {'events':>12} {'rss MB':>8} {'rx MB':>9} {'eta s':>7}"]
+    done = 0
+    for label, record in sorted(state.items()):
+        progress = record["sim_time"] / record["stop_time"] if record.get("stop_time") else 0.0
+        ratio = record.get("ratio", 0.0)
+        eta = (record["stop_time"] - record["sim_time"]) / ratio if ratio > 0 and not record.get("done") else 0.0
+        rx = sum(record.get("rx_bytes", {}).values()) / 2**20
+        done += bool(record.get("done"))
+        rows.append(f"{label[:32]:<32} {record['sim_time']:>8.2f} {progress:>8.0%} {ratio:>9.2f} "
+                    f"{record.get('events', 0):>12} {record.get('rss_mb', 0.0):>8.1f} {rx:>9.2f} {eta:>7.0f}"
+                    + ("  done" if record.get("done") else ""))
+    rows.append(f"{done}/{len(state)} runs done")
+    return "\n".join(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Progress view of the telemetry of running simulations.")
+    parser.add_argument("files", nargs="*", help="telemetry files or globs to follow")
+    parser.add_argument("--listen", help="also receive telemetry datagrams on host:port")
+    parser.add_argument("--refresh", type=float, default=1.0, help="seconds between redraws")
+    parser.add_argument("--once", action="store_true", help="print the view once and exit")
+    args = parser.parse_args(argv)
+
+    state, positions = {}, {}
+    receiver = None
+    if args.listen:
+        host, port = args.listen.rsplit(":", 1)
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind((host, int(port)))
+        receiver.setblocking(False)
+
+    while True:
+        for path in sorted({p for pattern in args.files for p in glob.glob(pattern)}):
+            with open(path, "rb") as f:
+                f.seek(positions.get(path, 0))
+                data = f.read()
+            # A writer may be halfway through a record; leave it for the next round.
+            complete = data.rfind(b"\n") + 1
+            aggregate(data[:complete].decode().splitlines(), state)
+            positions[path] = positions.get(path, 0) + complete
+        while receiver is not None:
+            try:
+                aggregate([receiver.recv(65536).decode()], state)
+            except BlockingIOError:
+                break
+        view = render(state)
+        if args.once:
+            print(view)
+            return
+        print("\033[2J\033[H" + view, flush=True)
+        time.sleep(args.refresh)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from collections import deque
+
+from .model import LINK_NAMES, LINKS, N_NODES
+
+
+# Directed links: 2 * i is a -> b of the i-th link in LINKS, 2 * i + 1 is b -> a.
+N_DIRECTED = 2 * len(LINKS)
+
+
+def shortest_path(src: int, dst: int) -> list:
+    """The nodes of the hop-count shortest path from src to dst, as global routing picks it."""
+    neighbours = {node: [] for node in range(N_NODES)}
+    for a, b in LINKS.values():
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+    previous = {src: None}
+    queue = deque([src])
+    while queue:
+        node = queue.popleft()
+        for neighbour in sorted(neighbours[node]):
+            if neighbour not in previous:
+                previous[neighbour] = node
+                queue.append(neighbour)
+    if dst not in previous:
+        raise ValueError(f"There is no path from node {src} to node {dst}.")
+    path = [dst]
+    while path[-1] != src:
+        path.append(previous[path[-1]])
+    return path[::-1]
+
+
+def directed_link(a: int, b: int) -> int:
+    for i, (x, y) in enumerate(LINKS.values()):
+        if (x, y) == (a, b):
+            return 2 * i
+        if (y, x) == (a, b):
+            return 2 * i + 1
+    raise ValueError(f"Nodes {a} and {b} are not connected.")
+
+
+def interface_address(link: str, node: int) -> str:
+    """The address Model assigns to node on link."""
+    i = LINK_NAMES.index(link)
+    return f"10.1.{i + 1}.{1 if LINKS[link][0] == node else 2}"
+
+
+def source_address(src: int, dst: int) -> str:
+    """The address of the interface src sends on towards dst."""
+    path = shortest_path(src, dst)
+    first_link = next(name for name, nodes in LINKS.items() if set(nodes) == set(path[:2]))
+    return interface_address(first_link, src)
+
+
+def match_flows(scenario, result) -> list:
+    """
+    The FlowStats of result belonging to every application of scenario, or None where there is
+    none. Flows are matched on protocol, addresses and destination port.
+    """
+    flows = {(flow.protocol, flow.source, flow.destination, flow.destination_port): flow
+             for flow in result.flows}
+    return [flows.get((kind, source_address(src, dst), interface_address(dst_addr, LINKS[dst_addr][0]), port))
+            for src, dst, dst_addr, _, _, kind, port in scenario.applications]
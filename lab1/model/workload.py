@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .model import STOP_TIME
+from .topology import interface_address
+
+
+BASE_PORT       = 10000     # flow i is sent to port BASE_PORT + i
+MAX_PORT        = 49152     # ns-3 picks ephemeral ports from here on
+PERCENTILES     = (50, 95, 99)
+
+
+@dataclass
+class Workload:
+    """
+    > A batch of finite TCP flows as columns (one entry per flow), installed with
+      Model.add_finite_flows. Build one with incast or poisson:
+        '''
+        workload = incast(senders=[0, 2, 3, 4], dst=1, dst_addr="n1n6", size=20000,
+                          start=1.0, rounds=50, interval=0.5)
+        workload.install(model)
+        result = model.start()
+        fct = flow_completion_times(result, workload)     # {size: FCT array}
+        '''
+    > To compare TCP variants on the same flows, run them as Scenarios:
+        '''
+        scenarios = [Scenario(NetworkParams(latency_ms=10), variant, finite_flows=workload.rows())
+                     for variant in TCPVersion]
+        results = run_many(scenarios, store)
+        print(fct_table((s.tcp_version.name, flow_completion_times(r, workload))
+                        for s, r in zip(scenarios, results)))
+        '''
+    > Every flow has a destination port and sink of its own, which maps its FlowMonitor flow
+      back to it and makes the sink's received bytes (result.sink_rx) its delivered
+      application bytes. FlowMonitor alone cannot tell completion, its received bytes count
+      retransmitted duplicates. The price is a sink and a client install per flow, and a
+      workload of at most MAX_PORT - BASE_PORT flows. FCTs are grouped into buckets by flow size.
+    """
+    src_nodes: np.ndarray
+    dst_nodes: np.ndarray
+    dst_addrs: list
+    start_times: np.ndarray
+    sizes: np.ndarray
+    buckets: tuple      = ()
+
+    def __len__(self):
+        return len(self.src_nodes)
+
+    @property
+    def ports(self) -> np.ndarray:
+        return BASE_PORT + np.arange(len(self))
+
+    def install(self, model):
+        model.add_finite_flows(self.src_nodes, self.dst_nodes, self.dst_addrs,
+                               self.start_times, self.sizes, self.ports)
+
+    def rows(self) -> list:
+        """(src, dst, dst_addr, start, size, port) per flow, the form kept in Scenario.finite_flows."""
+        return [(int(src), int(dst), dst_addr, float(start), int(size), int(port))
+                for src, dst, dst_addr, start, size, port
+                in zip(self.src_nodes, self.dst_nodes, self.dst_addrs, self.start_times, self.sizes, self.ports)]
+
+    @classmethod
+    def from_rows(cls, rows):
+        src, dst, dst_addr, start, size, _ = zip(*rows) if rows else ([],) * 6
+        sizes = np.array(size, dtype=np.int64)
+        return cls(np.array(src, dtype=int), np.array(dst, dtype=int), list(dst_addr),
+                   np.array(start, dtype=float), sizes, tuple(int(s) for s in np.unique(sizes)))
+
+
+def _workload(src, dst, dst_addr, start, sizes) -> Workload:
+    order = np.argsort(start, kind="stable")
+    sizes = np.asarray(sizes, dtype=np.int64)[order]
+    if (np.asarray(start) >= STOP_TIME).any():
+        raise ValueError(f"Every flow should start before the end of the run at {STOP_TIME}s.")
+    if len(order) > MAX_PORT - BASE_PORT:
+        raise ValueError(f"A workload has a port per flow and can hold at most {MAX_PORT - BASE_PORT} flows.")
+    return Workload(np.asarray(src, dtype=int)[order], np.full(len(order), dst), [dst_addr] * len(order),
+                    np.asarray(start, dtype=float)[order], sizes, tuple(int(s) for s in np.unique(sizes)))
+
+
+def incast(senders, dst: int, dst_addr: str, size: int, start: float = 1.0, rounds: int = 1,
+           interval: float = 1.0, flows_per_sender: int = 1) -> Workload:
+    """Every sender starts flows_per_sender flows of size bytes at once, every interval seconds."""
+    senders = np.repeat(np.asarray(senders, dtype=int), flows_per_sender)
+    starts = start + interval * np.arange(rounds)
+    return _workload(np.tile(senders, rounds), dst, dst_addr, np.repeat(starts, len(senders)),
+                     np.full(len(senders) * rounds, size))
+
+
+def poisson(senders, dst: int, dst_addr: str, sizes, rate: float, start: float = 1.0,
+            stop: float = STOP_TIME - 10, probabilities=None, seed: int = 42) -> Workload:
+    """
+    Flows arriving as a Poisson process of rate flows per second between start and stop, each
+    from a random sender with a size drawn from sizes (with probabilities, default uniform).
+    """
+    if rate <= 0:
+        raise ValueError(f"The arrival rate {rate} should be larger than 0.")
+    rng = np.random.default_rng(seed)
+    n = rng.poisson(rate * (stop - start))
+    starts = np.sort(rng.uniform(start, stop, n))
+    return _workload(rng.choice(np.asarray(senders, dtype=int), n), dst, dst_addr, starts,
+                     rng.choice(np.asarray(sizes, dtype=np.int64), n, p=probabilities))
+
+
+def flow_completion_times(result, workload: Workload) -> dict:
+    """
+    size -> FCT (last_rx - first_tx of its FlowMonitor flow, seconds) of every flow of that size
+    bucket. A flow completed once its sink received all size bytes (result.sink_rx); the flows
+    that did not before the end of the run are NaN.
+    """
+    flows = {(flow.destination, flow.destination_port): flow for flow in result.flows if flow.protocol == "TCP"}
+    sink_rx = result.sink_rx or {}
+    fct = {size: [] for size in workload.buckets}
+    for dst, dst_addr, size, port in zip(workload.dst_nodes, workload.dst_addrs, workload.sizes, workload.ports):
+        flow = flows.get((interface_address(dst_addr, dst), port))
+        done = flow is not None and sink_rx.get(f"n{dst}:{port}", 0) >= size
+        fct[size].append(flow.last_rx - flow.first_tx if done else np.nan)
+    return {size: np.array(values, dtype=float) for size, values in fct.items()}
+
+
+def fct_percentiles(fct: dict, percentiles=PERCENTILES) -> dict:
+    """size -> (flows, completed, FCT percentiles of the completed flows)."""
+    summary = {}
+    for size, values in fct.items():
+        done = values[~np.isnan(values)]
+        summary[size] = (len(values), len(done),
+                         tuple(np.percentile(done, percentiles)) if len(done) else (np.nan,) * len(percentiles))
+    return summary
+
+
+def fct_table(rows, percentiles=PERCENTILES) -> str:
+    """Text table of (label, fct) rows, e.g. one per TCP variant, by size bucket."""
+    header = "".join(f" {f'p{p} ms':>10}" for p in percentiles)
+    lines = [f"{'variant':<12} {'size':>10} {'flows':>7} {'done':>7}{header}"]
+    for label, fct in rows:
+        for size, (flows, done, values) in fct_percentiles(fct, percentiles).items():
+            lines.append(f"{label:<12} {size:>10} {flows:>7} {done:>7}" +
+                         "".join(f" {value * 1000:>10.2f}" for value in values))
+    return "\n".join(lines)
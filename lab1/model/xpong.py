@@ -0,0 +1,104 @@
+import struct
+
+import numpy as np
+import ns.core
+import ns.network
+
+
+# The XPong protocol of lab2: net_packet_t {uint8 cmd; uint16 epoch; uint8 input} in network order.
+OP_CMD, OP_ACK = 0, 1
+CMD_NONE, CMD_UP, CMD_DOWN = 0, 1, 2
+PACKET = struct.Struct("!BHB")
+SIM_INTERVAL = 0.01         # SIM_INTERVAL of xpong.c, one epoch attempt per tick
+
+
+class XPongPeer:
+    """
+    > One player of lab2's xpong.c on a Model node, ticking every SIM_INTERVAL. Like xpong.c it
+      handles the packets received since the previous tick at the start of every tick: it ACKs
+      every CMD of the current or an earlier epoch, then sends the CMD of the current epoch and
+      moves to the next epoch once it has both the ACK and the CMD of the other player.
+    > Packets are 4 bytes on the wire. Their content travels in a table keyed by the packet
+      uid, which ns-3 keeps end to end, since the Python bindings cannot fill packet buffers.
+      Model.start clears it after the run.
+    > latency holds the time from the first CMD of every epoch until it completed (NaN if it
+      never did) and retransmissions the CMDs sent for it beyond the first, including the one
+      xpong.c sends in the tick the epoch completes.
+    """
+    payloads = {}       # packet uid -> net_packet_t bytes, shared by all peers
+
+    def __init__(self, node, port: int, player: int, start_time: float, stop_time: float, seed: int = 42):
+        self.node = node
+        self.port = port
+        self.player = player
+        self.start_time = start_time
+        self.stop_time = stop_time
+        self.rng = np.random.default_rng([seed, player, port])
+        self.socket = None
+        self.peer = None
+        self.epoch = 0
+        self.cmd = self.ack = self.cmd_self = False
+        self.input = CMD_NONE
+        self.received = []      # (cmd, epoch, input) since the last tick
+        epochs = int((stop_time - start_time) / SIM_INTERVAL) + 1
+        self.epoch_start = np.full(epochs, np.nan)
+        self.latency = np.full(epochs, np.nan)
+        self.retransmissions = np.zeros(epochs, dtype=np.int64)
+
+    def install(self, peer_address):
+        tid = ns.core.TypeId.LookupByName("ns3::UdpSocketFactory")
+        self.socket = ns.network.Socket.CreateSocket(self.node, tid)
+        self.socket.Bind(ns.network.Address(ns.network.InetSocketAddress(ns.network.Ipv4Address.GetAny(), self.port)))
+        self.socket.SetRecvCallback(self.receive)
+        self.peer = ns.network.Address(ns.network.InetSocketAddress(peer_address, self.port))
+        ns.core.Simulator.Schedule(ns.core.Seconds(self.start_time), self.tick)
+
+    def send(self, cmd: int, epoch: int, input: int):
+        packet = ns.network.Packet(PACKET.size)
+        XPongPeer.payloads[packet.GetUid()] = PACKET.pack(cmd, epoch % 2**16, input)
+        self.socket.SendTo(packet, 0, self.peer)
+
+    def receive(self, socket):
+        # xpong.c only reads its socket once per tick, so keep the packets for the next tick.
+        while True:
+            packet = socket.Recv()
+            if not packet:
+                break
+            payload = XPongPeer.payloads.pop(packet.GetUid(), None)
+            if payload is not None:
+                self.received.append(PACKET.unpack(payload))
+
+    def handle_received(self):
+        current = self.epoch % 2**16
+        for cmd, epoch, _ in self.received:
+            if cmd == OP_ACK and epoch == current:
+                self.ack = True
+            elif cmd == OP_CMD and (current - epoch) % 2**16 < 2**15:
+                if epoch == current:
+                    self.cmd = True
+                self.send(OP_ACK, epoch, 0)
+        self.received.clear()
+
+    def tick(self):
+        now = ns.core.Simulator.Now().GetSeconds()
+        if now >= self.stop_time or self.epoch >= len(self.latency):
+            return
+        self.handle_received()
+        if not self.cmd_self:
+            self.input = int(self.rng.integers(CMD_NONE, CMD_DOWN + 1))
+            self.cmd_self = True
+            self.epoch_start[self.epoch] = now
+        else:
+            self.retransmissions[self.epoch] += 1
+        self.send(OP_CMD, self.epoch, self.input)
+
+        if self.ack and self.cmd:
+            self.latency[self.epoch] = now - self.epoch_start[self.epoch]
+            self.epoch += 1
+            self.cmd = self.ack = self.cmd_self = False
+        ns.core.Simulator.Schedule(ns.core.Seconds(SIM_INTERVAL), self.tick)
+
+    def stats(self) -> dict:
+        return {"epoch_start": self.epoch_start[:self.epoch + 1],
+                "latency": self.latency[:self.epoch + 1],
+                "retransmissions": self.retransmissions[:self.epoch + 1]}